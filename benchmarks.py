@@ -0,0 +1,442 @@
+"""Benchmarks for the warehouse app's hot paths
+
+Run with:
+    python benchmarks.py search --rows 1000 50000 500000
+    python benchmarks.py startup
+    python benchmarks.py scan --rows 1000 50000 500000
+    python benchmarks.py paths --rows 1000 50000 500000 --latency 0.08
+    python benchmarks.py memory --rows 100000 --sessions 20
+    python benchmarks.py events --events 10000 1000000
+    python benchmarks.py export --rows 100000 500000
+    python benchmarks.py quota --per-user 120 --requests 140
+"""
+import argparse
+import csv
+import io
+import json
+import random
+import string
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+import warehouse_app
+from fake_sheets import FakeSheetsBackend
+from warehouse_app import (EXPORT_FORMATS, SCOPES, EventLog, KeyIndex, SheetSnapshot, SheetsServicePool, TrigramIndex,
+                           build_service, export_stream, iter_sheet_rows, linear_search)
+
+HANDOVER_HEADERS = ['Order No', 'Vendor', 'Customer', 'City', 'Date', 'Items', 'Tracking', 'Handedover Status']
+BUNDLING_HEADERS = ['Fleek/Order ID', 'Bundle ID', 'Customer', 'Vendor', 'Items', 'Packing Status']
+
+
+def make_rows(count, seed=7):
+    """Synthetic handover rows shaped like the real sheet"""
+    rng = random.Random(seed)
+    vendors = [f"Vendor {''.join(rng.choices(string.ascii_uppercase, k=5))}" for _ in range(200)]
+    cities = ['Lahore', 'Karachi', 'Islamabad', 'Faisalabad', 'Multan', 'Peshawar']
+    rows = []
+    for i in range(count):
+        rows.append([
+            f"FO-{100000 + i}",
+            rng.choice(vendors),
+            f"Customer {rng.randrange(count // 3 + 1)}",
+            rng.choice(cities),
+            f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            str(rng.randint(1, 9)),
+            ''.join(rng.choices(string.ascii_uppercase + string.digits, k=12)),
+            rng.choice(['', '', 'Done']),
+        ])
+    return rows
+
+
+def make_bundling_rows(count, seed=11):
+    """Synthetic bundling rows shaped like the real sheet"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append([
+            f"FO-{100000 + i}",
+            f"B-{i // 3:06d}",
+            f"Customer {rng.randrange(count // 3 + 1)}",
+            f"Vendor {rng.randrange(200)}",
+            str(rng.randint(1, 9)),
+            rng.choice(['', '', 'Packed', 'Hold']),
+        ])
+    return rows
+
+
+def make_backend(count, **options):
+    """Fake backend holding both tabs at count data rows, laid out like the real sheets"""
+    # Handover data starts below two title rows, bundling data right under its header
+    handover = [['Inbound handover'], []] + [HANDOVER_HEADERS] + make_rows(count)
+    bundling = [BUNDLING_HEADERS] + make_bundling_rows(count)
+    assert len(handover) - count == warehouse_app.HANDOVER_HEADER_ROW
+    assert len(bundling) - count == warehouse_app.BUNDLING_HEADER_ROW
+    return FakeSheetsBackend({
+        warehouse_app.HANDOVER_SHEET_ID: {warehouse_app.HANDOVER_TAB: handover},
+        warehouse_app.BUNDLING_SHEET_ID: {warehouse_app.BUNDLING_TAB: bundling},
+    }, **options)
+
+
+def clear_caches():
+    """Forget every sheet snapshot and metadata entry, as after a server restart"""
+    warehouse_app.get_snapshot_cache.clear()
+    warehouse_app.get_metadata_cache.clear()
+
+
+def timed(fn, repeat=1):
+    """Best wall time of fn() in milliseconds, and its last result"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_search(row_counts, repeat):
+    """Trigram index vs the original linear scan"""
+    print(f"{'rows':>8} {'term':>14} {'matches':>8} {'scan ms':>10} {'index ms':>10} {'speedup':>8}")
+    for count in row_counts:
+        rows = make_rows(count)
+        build_ms, index = timed(lambda: TrigramIndex(rows))
+        print(f"{count:>8} {'(build)':>14} {'':>8} {'':>10} {build_ms:>10.1f}")
+        terms = [rows[count // 2][0], rows[count // 3][1][-5:], 'karachi', 'zzz-nothing', 'FO']
+        for term in terms:
+            scan_ms, expected = timed(lambda: linear_search(rows, term), repeat)
+            index_ms, found = timed(lambda: index.search(term), repeat)
+            assert found == expected, f"index disagrees with scan for {term!r}"
+            speedup = scan_ms / index_ms if index_ms else float('inf')
+            print(f"{count:>8} {term:>14} {len(found):>8} {scan_ms:>10.1f} {index_ms:>10.2f} {speedup:>7.0f}x")
+
+
+def bench_scan(row_counts, scans):
+    """Scan-station exact lookups against a warm Order No key index"""
+    print(f"{'rows':>8} {'build ms':>10} {'scans':>6} {'avg us':>8} {'max us':>8}")
+    for count in row_counts:
+        rows = make_rows(count)
+        build_ms, index = timed(lambda: KeyIndex(rows, (0,)))
+        rng = random.Random(count)
+        codes = [f"  {rows[rng.randrange(count)][0].lower()} " for _ in range(scans)]
+        worst = total = 0.0
+        for code in codes:
+            start = time.perf_counter()
+            assert index.lookup(code)
+            elapsed = (time.perf_counter() - start) * 1e6
+            total += elapsed
+            worst = max(worst, elapsed)
+        print(f"{count:>8} {build_ms:>10.1f} {scans:>6} {total / scans:>8.1f} {worst:>8.1f}")
+
+
+def measure(backend, fn):
+    """Run fn once against backend: wall ms, reads, writes, errors, KB sent, KB received"""
+    backend.reset_counters()
+    elapsed, _ = timed(fn)
+    reads = sum(1 for kind, _ in backend.calls if kind == 'read')
+    return (elapsed, reads, len(backend.calls) - reads, backend.errors,
+            backend.bytes_sent / 1024, backend.bytes_received / 1024)
+
+
+def peak_memory(fn, cold):
+    """Peak Python allocation of fn() in MB; traced separately since tracing slows it down"""
+    if cold:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / 2 ** 20
+    finally:
+        tracemalloc.stop()
+
+
+def bench_paths(row_counts, latency, error_rate, memory):
+    """App entry points against the fake backend, cold (empty caches) and warm"""
+    # Benchmarks measure the app, not quota pacing: let the scheduler send everything
+    warehouse_app.SHEETS_READ_QUOTA = warehouse_app.SHEETS_WRITE_QUOTA = (10 ** 9, 10 ** 9)
+    warehouse_app.get_scheduler.clear()
+    print(f"{'rows':>8} {'path':<22} {'cache':<5} {'ms':>10} {'reads':>6} {'writes':>6} {'errors':>6} "
+          f"{'KB sent':>9} {'KB recv':>10} {'peak MB':>8}")
+    for count in row_counts:
+        backend = make_backend(count, latency=latency, error_rate=error_rate, seed=count)
+        service = backend.service()
+        middle = count // 2 + 1
+        paths = [
+            ('search_handover', lambda: warehouse_app.search_handover(service, f"FO-{100000 + count // 2}")),
+            ('search_bundling', lambda: warehouse_app.search_bundling(service, f"B-{count // 6:06d}")),
+            # Both sheets concurrently: cold cost should track the slower sheet, not the sum of the two above
+            ('search_everywhere', lambda: list(warehouse_app.search_everywhere(service, f"FO-{100000 + count // 2}"))),
+            ('get_pending_handover', lambda: warehouse_app.get_pending_handover(
+                service, 'Oldest first', limit=warehouse_app.RESULTS_PAGE_SIZE)),
+            # Writes carry the order ID seen at search time, so each costs a verify read plus the write
+            ('mark_handover', lambda: warehouse_app.mark_handover(
+                service, warehouse_app.HANDOVER_HEADER_ROW + middle, 'bench', f"FO-{100000 + middle - 1}")),
+            ('mark_bundling_status', lambda: warehouse_app.mark_bundling_status(
+                service, warehouse_app.BUNDLING_HEADER_ROW + middle, 'Packed', 'bench', f"FO-{100000 + middle - 1}")),
+        ]
+        for name, fn in paths:
+            for cache in ('cold', 'warm'):
+                if cache == 'cold':
+                    clear_caches()
+                elapsed, reads, writes, errors, sent, received = measure(backend, fn)
+                peak = f"{peak_memory(fn, cache == 'cold'):>8.1f}" if memory else f"{'-':>8}"
+                print(f"{count:>8} {name:<22} {cache:<5} {elapsed:>10.1f} {reads:>6} {writes:>6} {errors:>6} "
+                      f"{sent:>9.1f} {received:>10.1f} {peak}")
+
+
+def traced_mb(fn):
+    """Python memory still held after fn() in MB, and fn's result (kept alive while measured)"""
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[0] / 2 ** 20, result
+    finally:
+        tracemalloc.stop()
+
+
+def bench_memory(row_counts, sessions, term):
+    """Resident cost of a handover snapshot, and of every session holding a broad search's results"""
+    print(f"{'rows':>8} {'layout':<30} {'snapshot MB':>12} {'matches':>8} {f'{sessions} sessions MB':>16}")
+    for count in row_counts:
+        # Round-trip through JSON so every cell is its own string object, as after parsing an API response
+        payload = json.dumps([HANDOVER_HEADERS] + make_rows(count))
+        headers = HANDOVER_HEADERS
+
+        def legacy_results(values, index):
+            # What search_handover used to hand each session: a padded copy and a dict per match
+            return [{'row_index': pos + 2,
+                     'data': dict(zip(headers, values[pos + 1] + [''] * (len(headers) - len(values[pos + 1]))))}
+                    for pos in index.search(term)]
+
+        def columnar_results(snapshot, index):
+            return snapshot.matches(snapshot.query(term))
+
+        layouts = (
+            ('list of lists + dict matches', lambda: json.loads(payload),
+             lambda values: TrigramIndex(values[1:]), legacy_results),
+            ('columnar + row views', lambda: SheetSnapshot(json.loads(payload), 1),
+             lambda snapshot: snapshot.search_index(), columnar_results),
+        )
+        for layout, load, build_index, search in layouts:
+            snapshot_mb, snapshot = traced_mb(load)
+            # The search index is shared by every session either way; build it outside the measurement
+            index = build_index(snapshot)
+            results_mb, results = traced_mb(lambda: [search(snapshot, index) for _ in range(sessions)])
+            print(f"{count:>8} {layout:<30} {snapshot_mb:>12.1f} {len(results[0]):>8} {results_mb:>16.1f}")
+
+
+def bench_events(event_counts, repeat):
+    """Throughput dashboard cost: recording events and reading the summary, against history size"""
+    print(f"{'events':>9} {'record us/event':>16} {'summary ms':>11}")
+    rng = random.Random(3)
+    users = [f"Operator {n}" for n in range(40)]
+    now = time.time()
+    for count in event_counts:
+        log = EventLog()
+        events = [{
+            'ts': now - rng.random() * 30 * 86400, 'stage': rng.choice(['Handover', 'Bundling']),
+            'user': rng.choice(users), 'status': rng.choice(['Done', 'Packed', 'Hold', 'Issue']),
+            'order': f"FO-{n}", 'row': n + 4, 'days': rng.randrange(20), 'source': 'bench',
+        } for n in range(count)]
+        record_ms, _ = timed(lambda: log.record(events))
+        summary_ms, _ = timed(lambda: log.summary(24, now), repeat)
+        print(f"{count:>9} {record_ms * 1000 / count:>16.2f} {summary_ms:>11.2f}")
+
+
+def bench_export(row_counts, formats):
+    """Exporting the pending queue: whole sheet read then written vs streamed a chunk at a time"""
+    print(f"{'rows':>8} {'format':<8} {'path':<22} {'ms':>9} {'MB out':>8} {'peak MB':>8}")
+    spec = {'stage': 'Handover', 'kind': 'pending', 'query': ''}
+    # Exports read at background priority; measure the export, not quota pacing
+    warehouse_app.SHEETS_READ_QUOTA = warehouse_app.SHEETS_WRITE_QUOTA = (10 ** 9, 10 ** 9)
+    warehouse_app.get_scheduler.clear()
+    for count in row_counts:
+        backend = make_backend(count)
+        service = backend.service()
+
+        def whole_sheet():
+            # What a report built from a full download holds: every row, then the whole file
+            _, tab, header_row = warehouse_app.SEARCH_STAGES['Handover']
+            values = list(iter_sheet_rows(service, warehouse_app.HANDOVER_SHEET_ID, tab, header_row))
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(values)
+            return len(buffer.getvalue().encode('utf-8'))
+
+        def streamed(fmt):
+            return sum(len(data) for data in export_stream(service, spec, fmt))
+
+        paths = [('CSV', 'whole sheet, then file', whole_sheet)]
+        paths += [(fmt, 'streamed export', lambda fmt=fmt: streamed(fmt)) for fmt in formats if fmt in EXPORT_FORMATS]
+        for fmt, path, fn in paths:
+            clear_caches()
+            elapsed, size = timed(fn)
+            peak = peak_memory(fn, cold=True)
+            print(f"{count:>8} {fmt:<8} {path:<22} {elapsed:>9.0f} {size / 2 ** 20:>8.1f} {peak:>8.1f}")
+
+
+def most_in_a_minute(times):
+    """Largest number of the sorted times that fall within any 60 second window"""
+    most = first = 0
+    for last, sent in enumerate(times):
+        while sent - times[first] >= 60:
+            first += 1
+        most = max(most, last - first + 1)
+    return most
+
+
+def bench_quota(per_minute, per_user, users, requests, workers):
+    """Scheduler against the quota-enforcing fake: concurrent reads never 429, and a 429 drains and backs off
+
+    Each user sends `requests` reads, more than their per-minute quota, so the run
+    takes over a minute and only pacing keeps the fake from throttling it.
+    """
+    warehouse_app.SHEETS_READ_QUOTA = (per_minute, per_user)
+    warehouse_app.get_scheduler.clear()
+    scheduler = warehouse_app.get_scheduler()
+    backend = make_backend(10, quotas={'read': (per_minute, per_user)})
+    services = [backend.service(f"user{n}@example.com") for n in range(users)]
+    sent_at = {}
+    call = backend.call
+
+    def timed_call(user, kind, fn, body=None):
+        sent_at.setdefault(user, []).append(time.monotonic())
+        return call(user, kind, fn, body)
+    backend.call = timed_call
+
+    def read(service, priority=warehouse_app.PRIORITY_READ):
+        return warehouse_app.sheets_call(service.spreadsheets().values().get(
+            spreadsheetId=warehouse_app.HANDOVER_SHEET_ID, range=f"'{warehouse_app.HANDOVER_TAB}'!A1:A1"
+        ), priority=priority)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda n: read(services[n % users]), range(requests * users)))
+    elapsed = time.monotonic() - start
+    # A user's bucket starts full (a fifth of the quota) and then refills at the rest per minute
+    bucket = warehouse_app.TokenBucket(min(per_user, per_minute / users))
+    expected = (requests - bucket.capacity) / bucket.rate
+    busiest = max(most_in_a_minute(times) for times in sent_at.values())
+    busiest_project = most_in_a_minute(sorted(t for times in sent_at.values() for t in times))
+    print(f"{users} users x {requests} reads: {elapsed:.1f} s (pacing floor {expected:.1f} s), "
+          f"429s {backend.throttled}, busiest minute {busiest}/{per_user} per user, {busiest_project}/{per_minute} project")
+    assert backend.throttled == 0, "scheduled reads were throttled by the fake"
+    assert busiest <= per_user and busiest_project <= per_minute, "a 60 s window went over quota"
+    assert elapsed >= expected * 0.95, "reads were sent faster than the quota allows"
+
+    # Two injected 429s: the retries back off (1 s then 2 s, jittered down to half) and drain the buckets
+    drained = []
+    throttled = scheduler.throttled
+
+    def record_drain(kind, user):
+        throttled(kind, user)
+        drained.append(scheduler.stats()['tokens'][kind])
+    scheduler.throttled = record_drain
+    stats = scheduler.stats()
+    backend.fail_next(429, count=2, kind='read')
+    retry_ms, _ = timed(lambda: read(services[0]))
+    del scheduler.throttled
+    after = scheduler.stats()
+    print(f"2 x 429: answered after {retry_ms / 1000:.1f} s, retries {after['retries'] - stats['retries']}, "
+          f"project tokens after each 429 {', '.join(f'{tokens:.1f}' for tokens in drained)}")
+    assert after['retries'] - stats['retries'] == 2 and after['throttled'] - stats['throttled'] == 2
+    assert retry_ms >= 1500, "429 retries didn't back off"
+    assert len(drained) == 2 and max(drained) < 1, "a 429 didn't drain the project bucket"
+
+    # The same burst without the scheduler: the fake really does enforce the quota
+    backend.reset_counters()
+    for _ in range(per_user + 1):
+        try:
+            services[0].spreadsheets().values().get(
+                spreadsheetId=warehouse_app.HANDOVER_SHEET_ID, range=f"'{warehouse_app.HANDOVER_TAB}'!A1:A1"
+            ).execute()
+        except warehouse_app.HttpError:
+            pass
+    print(f"unscheduled burst of {per_user + 1}: {backend.throttled} throttled")
+    assert backend.throttled > 0, "the fake never throttled an unscheduled burst"
+
+
+def bench_startup(repeat):
+    """Per-rerun cost of getting a Sheets service: fresh build vs cached discovery vs pool"""
+    info = {'token': 'bench-token', 'refresh_token': 'bench-refresh'}
+
+    def fresh_credentials():
+        return Credentials(
+            token=info['token'],
+            refresh_token=info['refresh_token'],
+            token_uri="https://oauth2.googleapis.com/token",
+            client_id='bench-client',
+            client_secret='bench-secret',
+            scopes=SCOPES
+        )
+
+    pool = SheetsServicePool(warehouse_app.POOL_MAX_USERS, warehouse_app.POOL_IDLE_SECONDS)
+    pool.get(info, 'bench-client', 'bench-secret')
+    cases = [
+        ('build() per rerun (before)', lambda: build('sheets', 'v4', credentials=fresh_credentials())),
+        ('cached discovery document', lambda: build_service('sheets', 'v4', fresh_credentials())),
+        ('pooled service (after)', lambda: pool.get(info, 'bench-client', 'bench-secret')),
+    ]
+    print(f"{'service setup':<30} {'ms per rerun':>14}")
+    for name, fn in cases:
+        fn()
+        elapsed, _ = timed(lambda: [fn() for _ in range(repeat)])
+        print(f"{name:<30} {elapsed / repeat:>14.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+    search = sub.add_parser('search', help='substring search: trigram index vs linear scan')
+    search.add_argument('--rows', type=int, nargs='+', default=[1000, 50000, 500000])
+    search.add_argument('--repeat', type=int, default=3)
+    scan = sub.add_parser('scan', help='scan-station exact lookup latency')
+    scan.add_argument('--rows', type=int, nargs='+', default=[1000, 50000, 500000])
+    scan.add_argument('--scans', type=int, default=1000)
+    paths = sub.add_parser('paths', help='search, mark and pending-list cost against a fake Sheets backend')
+    paths.add_argument('--rows', type=int, nargs='+', default=[1000, 50000, 500000])
+    paths.add_argument('--latency', type=float, default=0.0, help='simulated seconds per Sheets request')
+    paths.add_argument('--error-rate', type=float, default=0.0, help='chance a request fails with a 5xx')
+    paths.add_argument('--no-memory', dest='memory', action='store_false', help='skip the traced peak-memory run')
+    memory = sub.add_parser('memory', help='snapshot and per-session result memory: list rows vs columnar store')
+    memory.add_argument('--rows', type=int, nargs='+', default=[100000])
+    memory.add_argument('--sessions', type=int, default=20)
+    memory.add_argument('--term', default='karachi', help='search every session runs; broad by default')
+    events = sub.add_parser('events', help='status event recording and throughput summary cost')
+    events.add_argument('--events', type=int, nargs='+', default=[10000, 1000000])
+    events.add_argument('--repeat', type=int, default=5)
+    export = sub.add_parser('export', help='peak memory of exporting the pending queue: whole sheet vs streamed')
+    export.add_argument('--rows', type=int, nargs='+', default=[100000, 500000])
+    export.add_argument('--formats', nargs='+', default=['CSV', 'Parquet'])
+    quota = sub.add_parser('quota', help='scheduler against the quota-enforcing fake (takes over a minute)')
+    quota.add_argument('--per-minute', type=int, default=300, help='project read quota per minute')
+    quota.add_argument('--per-user', type=int, default=120, help='per-user read quota per minute')
+    quota.add_argument('--users', type=int, default=2)
+    quota.add_argument('--requests', type=int, default=140, help='reads per user; above --per-user to span a minute')
+    quota.add_argument('--workers', type=int, default=16)
+    startup = sub.add_parser('startup', help='per-rerun Sheets service construction cost')
+    startup.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.bench == 'search':
+        bench_search(args.rows, args.repeat)
+    elif args.bench == 'scan':
+        bench_scan(args.rows, args.scans)
+    elif args.bench == 'paths':
+        bench_paths(args.rows, args.latency, args.error_rate, args.memory)
+    elif args.bench == 'memory':
+        bench_memory(args.rows, args.sessions, args.term)
+    elif args.bench == 'events':
+        bench_events(args.events, args.repeat)
+    elif args.bench == 'export':
+        bench_export(args.rows, args.formats)
+    elif args.bench == 'quota':
+        bench_quota(args.per_minute, args.per_user, args.users, args.requests, args.workers)
+    elif args.bench == 'startup':
+        bench_startup(args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""In-process fake of the Google Sheets API surface used by warehouse_app
+
+Covers spreadsheets().get (properties plus grid data with cell notes),
+values().get / values().batchGet / values().update and
+batchUpdate(updateCells), and enforces
+per-minute read/write quotas per project and per user the way Sheets does,
+answering 429 when they are exceeded. Requests can be given network latency
+and failed with injected errors, and the JSON bytes each way are counted.
+
+    backend = FakeSheetsBackend({SHEET_ID: {'Tab': rows}}, quotas={'read': (300, 60)},
+                                latency=0.08, error_rate=0.01)
+    service = backend.service('alice@example.com')
+    backend.fail_next(503, kind='write')
+"""
+import json
+import random
+import re
+import threading
+import time
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+def column_index(letters):
+    """0-based column index of A1 column letters"""
+    idx = 0
+    for ch in letters:
+        idx = idx * 26 + ord(ch) - 64
+    return idx - 1
+
+
+def parse_a1(range_name):
+    """Split 'Tab'!A3:Z1000 into (tab, first_row, last_row, first_col, last_col), 1-based rows, 0-based cols"""
+    tab, _, a1 = range_name.rpartition('!')
+    tab = tab.strip("'").replace("''", "'")
+    match = re.fullmatch(r'([A-Z]*)(\d*)(?::([A-Z]*)(\d*))?', a1)
+    if not tab or match is None:
+        raise ValueError(f"Unable to parse range: {range_name}")
+    col1, row1, col2, row2 = match.groups()
+    open_end = match.group(3) is None
+    first_row = int(row1) if row1 else 1
+    last_row = int(row2) if row2 else (first_row if open_end and row1 else None)
+    first_col = column_index(col1) if col1 else 0
+    last_col = column_index(col2) if col2 else (first_col if open_end and col1 else None)
+    return tab, first_row, last_row, first_col, last_col
+
+
+def http_error(status, message):
+    """HttpError shaped like the ones googleapiclient raises"""
+    body = json.dumps({'error': {'code': status, 'message': message}}).encode()
+    return HttpError(httplib2.Response({'status': status}), body)
+
+
+class FakeCredentials:
+    """Just enough of google.oauth2 credentials to tell users apart"""
+
+    def __init__(self, user):
+        self.token = f"token-{user}"
+        self.refresh_token = f"refresh-{user}"
+
+
+class FakeHttp:
+    def __init__(self, user):
+        self.credentials = FakeCredentials(user)
+
+
+class FakeRequest:
+    """Deferred call, executed like googleapiclient's HttpRequest"""
+
+    def __init__(self, backend, user, kind, method, fn, body=None):
+        self.http = backend.http_for(user)
+        self.methodId = f"sheets.spreadsheets.{method}"
+        self._backend = backend
+        self._user = user
+        self._kind = kind
+        self._fn = fn
+        self._body = body
+
+    def execute(self, http=None, num_retries=0):
+        return self._backend.call(self._user, self._kind, self._fn, self._body)
+
+
+class FakeSheetsBackend:
+    """Shared sheet data and quota counters behind any number of fake services"""
+
+    # Statuses error_rate picks from: the transient failures Sheets actually returns
+    TRANSIENT_STATUSES = (500, 502, 503)
+
+    def __init__(self, sheets, quotas=None, grid=None, latency=0.0, bytes_per_second=None,
+                 error_rate=0.0, seed=None):
+        # sheets: {spreadsheet_id: {tab: [row, ...]}} where rows[0] is sheet row 1
+        self.sheets = sheets
+        # quotas: {'read' | 'write': (per_project_per_minute, per_user_per_minute)}
+        self.quotas = quotas or {}
+        # grid: {tab: (row_count, column_count)} overrides, defaults fit the data
+        self.grid = grid or {}
+        # latency: seconds of round trip per request; bytes_per_second adds transfer time
+        self.latency = latency
+        self.bytes_per_second = bytes_per_second
+        # error_rate: chance each request fails with a random transient status
+        self.error_rate = error_rate
+        # notes: {(spreadsheet_id, tab, row_pos, col): note}, 0-based like the rows
+        self.notes = {}
+        self.lock = threading.Lock()
+        self.calls = []
+        self.throttled = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._random = random.Random(seed)
+        self._injected = []
+        self._windows = {}
+        self._https = {}
+
+    def http_for(self, user):
+        """One transport (and credentials object) per user, like a pooled real service"""
+        with self.lock:
+            return self._https.setdefault(user, FakeHttp(user))
+
+    def service(self, user='operator@example.com'):
+        return FakeSheetsService(self, user)
+
+    def _charge(self, user, kind):
+        """Count a request against this minute's quota; False if it is over"""
+        if kind not in self.quotas:
+            return True
+        window = int(time.time() // 60)
+        project_limit, user_limit = self.quotas[kind]
+        project_key, user_key = (window, kind, None), (window, kind, user)
+        if self._windows.get(project_key, 0) >= project_limit or self._windows.get(user_key, 0) >= user_limit:
+            return False
+        self._windows[project_key] = self._windows.get(project_key, 0) + 1
+        self._windows[user_key] = self._windows.get(user_key, 0) + 1
+        return True
+
+    def fail_next(self, status, count=1, kind=None):
+        """Fail the next count requests (of kind, if given) with status"""
+        with self.lock:
+            self._injected.extend([(status, kind)] * count)
+
+    def reset_counters(self):
+        """Zero the call, error and byte counters between measurements"""
+        with self.lock:
+            self.calls = []
+            self.throttled = self.errors = self.bytes_sent = self.bytes_received = 0
+
+    def _injected_error(self, kind):
+        for pos, (status, wanted_kind) in enumerate(self._injected):
+            if wanted_kind in (None, kind):
+                del self._injected[pos]
+                return status
+        if self.error_rate and self._random.random() < self.error_rate:
+            return self._random.choice(self.TRANSIENT_STATUSES)
+        return None
+
+    def call(self, user, kind, fn, body=None):
+        sent = len(json.dumps(body)) if body is not None else 0
+        try:
+            with self.lock:
+                self.calls.append((kind, user))
+                self.bytes_sent += sent
+                if not self._charge(user, kind):
+                    self.throttled += 1
+                    raise http_error(429, f"Quota exceeded for quota metric '{kind} requests'")
+                status = self._injected_error(kind)
+                if status is not None:
+                    self.errors += 1
+                    raise http_error(status, "Injected failure")
+                result = fn()
+                received = len(json.dumps(result))
+                self.bytes_received += received
+        except HttpError:
+            self._wait(sent)
+            raise
+        self._wait(sent + received)
+        return result
+
+    def _wait(self, size):
+        """Simulated network time, spent outside the lock so parallel requests overlap"""
+        delay = self.latency + (size / self.bytes_per_second if self.bytes_per_second else 0.0)
+        if delay:
+            time.sleep(delay)
+
+    def tab(self, spreadsheet_id, tab):
+        try:
+            return self.sheets[spreadsheet_id][tab]
+        except KeyError:
+            raise http_error(400, f"Unable to parse range: {tab}") from None
+
+    def grid_size(self, tab, rows):
+        return self.grid.get(tab, (max(1000, len(rows)), max(26, max(map(len, rows), default=0))))
+
+
+class FakeSheetsService:
+    """One user's view of the backend, mirroring service.spreadsheets()"""
+
+    def __init__(self, backend, user):
+        self.backend = backend
+        self.user = user
+
+    def spreadsheets(self):
+        return FakeSpreadsheets(self.backend, self.user)
+
+
+class FakeSpreadsheets:
+    def __init__(self, backend, user):
+        self.backend = backend
+        self.user = user
+
+    def values(self):
+        return FakeValues(self.backend, self.user)
+
+    def get(self, spreadsheetId, ranges=None, includeGridData=False, fields=None):
+        backend = self.backend
+
+        def run():
+            if spreadsheetId not in backend.sheets:
+                raise http_error(404, "Requested entity was not found.")
+            wanted = [parse_a1(range_name) for range_name in ranges or []]
+            sheets = []
+            for sheet_id, (title, rows) in enumerate(backend.sheets[spreadsheetId].items()):
+                tab_ranges = [parsed for parsed in wanted if parsed[0] == title]
+                if wanted and not tab_ranges:
+                    continue
+                row_count, col_count = backend.grid_size(title, rows)
+                sheet = {'properties': {
+                    'sheetId': sheet_id,
+                    'title': title,
+                    'gridProperties': {'rowCount': row_count, 'columnCount': col_count},
+                }}
+                if includeGridData:
+                    sheet['data'] = []
+                    for _, first_row, last_row, first_col, last_col in tab_ranges:
+                        row_data = []
+                        for row_pos in range(first_row - 1, min(len(rows), last_row or len(rows))):
+                            row = rows[row_pos]
+                            end = len(row) if last_col is None else last_col + 1
+                            values = []
+                            for col in range(first_col, end):
+                                cell = {'formattedValue': str(row[col])} if col < len(row) else {}
+                                note = backend.notes.get((spreadsheetId, title, row_pos, col))
+                                if note is not None:
+                                    cell['note'] = note
+                                values.append(cell)
+                            row_data.append({'values': values})
+                        data = {'rowData': row_data}
+                        if first_row > 1:
+                            data['startRow'] = first_row - 1
+                        if first_col:
+                            data['startColumn'] = first_col
+                        sheet['data'].append(data)
+                sheets.append(sheet)
+            if wanted and not sheets:
+                raise http_error(400, f"Unable to parse range: {ranges[0]}")
+            return {'spreadsheetId': spreadsheetId, 'sheets': sheets}
+
+        return FakeRequest(backend, self.user, 'read', 'get', run)
+
+    def batchUpdate(self, spreadsheetId, body):
+        backend = self.backend
+
+        def run():
+            tabs = list(backend.sheets.get(spreadsheetId, {}).items())
+            # Validate everything first: a real batchUpdate is all-or-nothing
+            for request in body['requests']:
+                if 'updateCells' not in request:
+                    raise http_error(400, f"Unsupported request: {list(request)}")
+                if request['updateCells']['range']['sheetId'] >= len(tabs):
+                    raise http_error(400, "Invalid requests[0].updateCells: No grid with id")
+            for request in body['requests']:
+                update = request['updateCells']
+                grid_range = update['range']
+                title, rows = tabs[grid_range['sheetId']]
+                for offset, row_data in enumerate(update['rows']):
+                    row_pos = grid_range['startRowIndex'] + offset
+                    while len(rows) <= row_pos:
+                        rows.append([])
+                    row = rows[row_pos]
+                    for col_offset, cell in enumerate(row_data['values']):
+                        col = grid_range['startColumnIndex'] + col_offset
+                        if 'userEnteredValue' in cell:
+                            if len(row) <= col:
+                                row.extend([''] * (col + 1 - len(row)))
+                            row[col] = next(iter(cell['userEnteredValue'].values()))
+                        if 'note' in cell:
+                            backend.notes[(spreadsheetId, title, row_pos, col)] = cell['note']
+            return {'spreadsheetId': spreadsheetId, 'replies': [{} for _ in body['requests']]}
+
+        return FakeRequest(backend, self.user, 'write', 'batchUpdate', run, body)
+
+
+class FakeValues:
+    def __init__(self, backend, user):
+        self.backend = backend
+        self.user = user
+
+    def _read(self, spreadsheetId, range):
+        """ValueRange of one A1 range, as values().get answers it"""
+        tab, first_row, last_row, first_col, last_col = parse_a1(range)
+        rows = self.backend.tab(spreadsheetId, tab)
+        selected = [
+            [str(cell) for cell in row[first_col:None if last_col is None else last_col + 1]]
+            for row in rows[first_row - 1:last_row]
+        ]
+        # Like Sheets, trailing empty cells and rows are left out
+        for row in selected:
+            while row and row[-1] == '':
+                row.pop()
+        while selected and not selected[-1]:
+            selected.pop()
+        result = {'range': range, 'majorDimension': 'ROWS'}
+        if selected:
+            result['values'] = selected
+        return result
+
+    def get(self, spreadsheetId, range):
+        return FakeRequest(self.backend, self.user, 'read', 'values.get',
+                           lambda: self._read(spreadsheetId, range))
+
+    def batchGet(self, spreadsheetId, ranges):
+        # One request (and one unit of quota) however many ranges it covers
+        return FakeRequest(self.backend, self.user, 'read', 'values.batchGet', lambda: {
+            'spreadsheetId': spreadsheetId,
+            'valueRanges': [self._read(spreadsheetId, range_name) for range_name in ranges],
+        })
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        backend = self.backend
+
+        def run():
+            tab, first_row, _, first_col, _ = parse_a1(range)
+            rows = backend.tab(spreadsheetId, tab)
+            for offset, values in enumerate(body['values']):
+                row_pos = first_row - 1 + offset
+                while len(rows) <= row_pos:
+                    rows.append([])
+                row = rows[row_pos]
+                if len(row) < first_col + len(values):
+                    row.extend([''] * (first_col + len(values) - len(row)))
+                row[first_col:first_col + len(values)] = values
+            return {'spreadsheetId': spreadsheetId, 'updatedRange': range}
+
+        return FakeRequest(backend, self.user, 'write', 'values.update', run, body)
@@ -2,11 +2,44 @@ import streamlit as st
 import os
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient import discovery_cache
 from googleapiclient.errors import HttpError
 import json
 from datetime import datetime
 import urllib.parse
+import sqlite3
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import itertools
+import contextvars
+import functools
+import http.server
+import socket
+import hashlib
+import random
+import sys
+import io
+import csv
+import secrets
+import httplib2
+import google_auth_httplib2
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Parquet exports need pyarrow (it ships with Streamlit); without it only CSV is offered
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 
 # Page config
 st.set_page_config(
@@ -20,6 +53,102 @@ HANDOVER_SHEET_ID = "1aUfprh_6DwhwVRVKk2PUj_OpeAtz0U_42i5ERTqJfB4"
 BUNDLING_SHEET_ID = "1pePWTFWezLEsRQylyHiWhvYh6gpxoEx1DaXfjWXsKEs"
 HANDOVER_TAB = "Inbound Dump"
 BUNDLING_TAB = "Albash working-2"
+HANDOVER_HEADER_ROW = 3
+BUNDLING_HEADER_ROW = 1
+
+# Stages searched together by Find Anywhere, in the order their results are shown
+SEARCH_STAGES = {
+    'Handover': (HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW),
+    'Bundling': (BUNDLING_SHEET_ID, BUNDLING_TAB, BUNDLING_HEADER_ROW),
+}
+
+# Rows fetched per values().get when paging through a tab, and how many pages may be in flight
+SHEET_CHUNK_ROWS = int(os.environ.get("SHEET_CHUNK_ROWS", "5000"))
+SHEET_READ_WORKERS = int(os.environ.get("SHEET_READ_WORKERS", "4"))
+
+# Status cells sent per batchUpdate by bulk writes
+BATCH_WRITE_CHUNK = int(os.environ.get("BATCH_WRITE_CHUNK", "500"))
+
+# Pre-write key checks: rows this close share one range, and ranges sent per batchGet
+VERIFY_RANGE_GAP = 20
+VERIFY_RANGES_PER_CALL = 100
+
+# Background status writer: how often queued writes are flushed, and how often a failing one is retried
+WRITE_FLUSH_INTERVAL = float(os.environ.get("WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_MAX_ATTEMPTS = int(os.environ.get("WRITE_MAX_ATTEMPTS", "5"))
+WRITE_RETRY_BASE_SECONDS = 1.0
+
+# Sheets API quotas (requests per minute) as (per project, per user); defaults match Google's standard quota
+SHEETS_READ_QUOTA = (int(os.environ.get("SHEETS_READS_PER_MINUTE", "300")),
+                     int(os.environ.get("SHEETS_READS_PER_MINUTE_PER_USER", "60")))
+SHEETS_WRITE_QUOTA = (int(os.environ.get("SHEETS_WRITES_PER_MINUTE", "300")),
+                      int(os.environ.get("SHEETS_WRITES_PER_MINUTE_PER_USER", "60")))
+SHEETS_MAX_RETRIES = int(os.environ.get("SHEETS_MAX_RETRIES", "5"))
+
+# Per-user Sheets services and keep-alive connections: most users pooled at once, and how
+# long an unused user's entry is kept (each login with prompt=consent is a new user key)
+POOL_MAX_USERS = int(os.environ.get("POOL_MAX_USERS", "200"))
+POOL_IDLE_SECONDS = float(os.environ.get("POOL_IDLE_SECONDS", "1800"))
+
+# Request priorities, lower goes first: operator writes, operator reads, background refreshes
+PRIORITY_WRITE = 0
+PRIORITY_READ = 1
+PRIORITY_BACKGROUND = 2
+
+# Result tables: rows per page, and the columns shown until the operator picks others
+RESULTS_PAGE_SIZE = int(os.environ.get("RESULTS_PAGE_SIZE", "25"))
+HANDOVER_RESULT_COLUMNS = ['Order No', 'Vendor', 'Customer', 'Handedover Status']
+BUNDLING_RESULT_COLUMNS = ['Fleek/Order ID', 'Bundle ID', 'Customer', 'Packing Status']
+
+# Local SQLite mirror of both tabs; empty disables it and reads use the snapshot cache
+SQLITE_MIRROR_PATH = os.environ.get("SQLITE_MIRROR_PATH", "")
+MIRROR_SYNC_INTERVAL = float(os.environ.get("MIRROR_SYNC_INTERVAL", "60"))
+
+# Performance metrics: rolling window for the sidebar panel, optional JSON-lines log and
+# Prometheus endpoint (port 0 disables it), and who may see the panel (empty: everyone)
+METRICS_WINDOW_SECONDS = float(os.environ.get("METRICS_WINDOW_SECONDS", "300"))
+METRICS_LOG_PATH = os.environ.get("METRICS_LOG_PATH", "")
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+METRICS_ADMINS = [email.strip().lower() for email in os.environ.get("METRICS_ADMINS", "").split(",") if email.strip()]
+
+# Status events behind the Throughput tab: append-only JSON-lines log (empty keeps them in memory only)
+EVENT_LOG_PATH = os.environ.get("EVENT_LOG_PATH", "")
+
+# Exports: sheet rows read and encoded per chunk, and the optional streaming download endpoint
+# (port 0 disables it and downloads are built in memory on click, up to EXPORT_MEMORY_MAX_ROWS
+# rows); EXPORT_PUBLIC_URL is the endpoint's address as the browser sees it (put it behind
+# HTTPS), and a link works once, within EXPORT_LINK_SECONDS, while its session is logged in
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_MEMORY_MAX_ROWS = int(os.environ.get("EXPORT_MEMORY_MAX_ROWS", "50000"))
+EXPORT_HOST = os.environ.get("EXPORT_HOST", "127.0.0.1")
+EXPORT_PORT = int(os.environ.get("EXPORT_PORT", "0"))
+EXPORT_PUBLIC_URL = os.environ.get("EXPORT_PUBLIC_URL", "").rstrip("/") or f"http://localhost:{EXPORT_PORT}"
+EXPORT_LINK_SECONDS = float(os.environ.get("EXPORT_LINK_SECONDS", "300"))
+
+# Handedover Status values that count as already handed over
+HANDOVER_DONE_STATUSES = ['done', 'completed', 'yes']
+
+# Packing Status values the bundling actions set, offered by the status export
+BUNDLING_STATUSES = ['Packed', 'Hold', 'Issue']
+
+# Pending list sort options, and the columns it shows by default
+PENDING_SORTS = ['Sheet order', 'Oldest first', 'Newest first', 'Vendor']
+PENDING_RESULT_COLUMNS = ['Order No', 'Vendor', 'Date', 'Age (days)']
+
+# Short field names for search queries like `vendor:acme status:hold order:123*`; any other
+# field matches the header it equals, or failing that the first header containing it
+QUERY_FIELD_ALIASES = {
+    'order': ['order no', 'fleek/order id'],
+    'status': ['handedover status', 'packing status'],
+    'bundle': ['bundle id'],
+}
+
+# Date formats seen in the sheets' date columns, tried in order
+SHEET_DATE_FORMATS = ['%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d-%b-%Y', '%d %b %Y', '%b %d, %Y', '%m/%d/%Y']
+
+# How long a cached sheet read is served before it is fetched again (seconds)
+SNAPSHOT_TTL_SECONDS = float(os.environ.get("SNAPSHOT_TTL_SECONDS", "30"))
 
 # OAuth Scopes
 SCOPES = [
@@ -68,7 +197,7 @@ def handle_oauth_callback(auth_code, state):
         credentials = flow.credentials
         
         # Get user info
-        user_info_service = build('oauth2', 'v2', credentials=credentials)
+        user_info_service = build_service('oauth2', 'v2', credentials)
         user_info = user_info_service.userinfo().get().execute()
         
         return credentials, user_info
@@ -76,272 +205,3868 @@ def handle_oauth_callback(auth_code, state):
         st.error(f"Authentication error: {str(e)}")
         return None, None
 
-def get_sheets_service(credentials):
-    """Create Sheets API service with user credentials"""
-    creds = Credentials(
-        token=credentials['token'],
-        refresh_token=credentials.get('refresh_token'),
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=st.secrets["GOOGLE_CLIENT_ID"],
-        client_secret=st.secrets["GOOGLE_CLIENT_SECRET"],
-        scopes=SCOPES
-    )
-    return build('sheets', 'v4', credentials=creds)
+def get_sheets_service(credentials):
+    """Get the pooled Sheets API service for the user's credentials"""
+    creds, service = get_service_pool().get(
+        credentials,
+        st.secrets["GOOGLE_CLIENT_ID"],
+        st.secrets["GOOGLE_CLIENT_SECRET"]
+    )
+    # Tokens refreshed by the pooled credentials go back into the session
+    if creds.token and creds.token != credentials.get('token'):
+        credentials['token'] = creds.token
+    return service
+
+# ============== SERVICE POOL ==============
+
+@st.cache_resource
+def get_discovery_document(api, version):
+    """Discovery document bundled with googleapiclient, parsed once per process"""
+    return json.loads(discovery_cache.get_static_doc(api, version))
+
+
+def build_service(api, version, credentials):
+    """API client on a keep-alive connection, built from the cached discovery document"""
+    http = google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+    return build_from_document(get_discovery_document(api, version), http=http)
+
+
+def credentials_key(credentials_info):
+    """Non-secret pool key for a user's stored credentials"""
+    secret = credentials_info.get('refresh_token') or credentials_info['token']
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+class SheetsServicePool:
+    """One Credentials object and Sheets service per user, reused across reruns and sessions
+
+    Least recently used first, entries are evicted once unused for idle_seconds or
+    when more than max_users are pooled, along with their pooled connections.
+    A session whose entry was evicted just gets a new one on its next rerun.
+    """
+
+    def __init__(self, max_users, idle_seconds):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # key -> (credentials, service, last used), least recently used first
+        self._entries = OrderedDict()
+
+    def get(self, credentials_info, client_id, client_secret):
+        key = credentials_key(credentials_info)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                creds = Credentials(
+                    token=credentials_info['token'],
+                    refresh_token=credentials_info.get('refresh_token'),
+                    token_uri="https://oauth2.googleapis.com/token",
+                    client_id=client_id,
+                    client_secret=client_secret,
+                    scopes=SCOPES
+                )
+                entry = (creds, build_service('sheets', 'v4', creds))
+            self._entries[key] = (*entry[:2], now)
+            evicted = self._evict(now)
+        for creds in evicted:
+            get_http_pool().discard(creds)
+        return entry[:2]
+
+    def _evict(self, now):
+        evicted = []
+        while self._entries:
+            key, (creds, _, used) = next(iter(self._entries.items()))
+            if len(self._entries) <= self.max_users and now - used < self.idle_seconds:
+                break
+            del self._entries[key]
+            evicted.append(creds)
+        return evicted
+
+    def discard(self, credentials_info):
+        with self._lock:
+            entry = self._entries.pop(credentials_key(credentials_info), None)
+        if entry is not None:
+            get_http_pool().discard(entry[0])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@st.cache_resource
+def get_service_pool():
+    """Single service pool for the whole server process"""
+    return SheetsServicePool(POOL_MAX_USERS, POOL_IDLE_SECONDS)
+
+
+class HttpPool:
+    """Idle keep-alive connections per credentials; each connection serves one thread at a time
+
+    A user's idle connections are closed once none has been used for idle_seconds,
+    or when the service pool lets go of their credentials.
+    """
+
+    MAX_IDLE_PER_USER = 8
+
+    def __init__(self, idle_seconds):
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        # id(credentials) -> (credentials, idle connections, last released), least recently used first
+        self._idle = OrderedDict()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, credentials):
+        with self._lock:
+            # Entries hold the credentials themselves, so id() can't be recycled while pooled
+            entry = self._idle.get(id(credentials))
+            if entry is not None and entry[1]:
+                self.reused += 1
+                return entry[1].pop()
+            self.created += 1
+        return google_auth_httplib2.AuthorizedHttp(credentials, http=httplib2.Http())
+
+    def release(self, credentials, http):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._idle.pop(id(credentials), None)
+            idle = entry[1] if entry is not None else []
+            self._idle[id(credentials)] = (credentials, idle, now)
+            if len(idle) < self.MAX_IDLE_PER_USER:
+                idle.append(http)
+                http = None
+            stale = []
+            while self._idle:
+                key, (_, connections, released) = next(iter(self._idle.items()))
+                if now - released < self.idle_seconds:
+                    break
+                del self._idle[key]
+                stale.extend(connections)
+        for connection in ([http] if http is not None else []) + stale:
+            connection.close()
+
+    def discard(self, credentials):
+        """Close and forget the idle connections of credentials that are no longer pooled"""
+        with self._lock:
+            entry = self._idle.pop(id(credentials), None)
+        for connection in entry[1] if entry is not None else []:
+            connection.close()
+
+
+# Getters reached from worker threads (parallel searches, write queue, mirror sync) must not show a
+# spinner: that needs the session's script context, which those threads don't have
+@st.cache_resource(show_spinner=False)
+def get_http_pool():
+    """Single keep-alive connection pool for the whole server process"""
+    return HttpPool(POOL_IDLE_SECONDS)
+
+
+def execute_threadsafe(request):
+    """Execute a request on a pooled keep-alive connection; httplib2 objects must not be shared between threads"""
+    credentials = getattr(getattr(request, 'http', None), 'credentials', None)
+    if credentials is None:
+        return request.execute()
+    http_pool = get_http_pool()
+    http = http_pool.acquire(credentials)
+    try:
+        return request.execute(http=http)
+    finally:
+        http_pool.release(credentials, http)
+
+# ============== METRICS ==============
+
+# Upper bounds of histogram buckets, Prometheus style (an implicit +Inf bucket follows)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+METRICS = {
+    'sheets_request_seconds': ('histogram of Sheets request round trips', DURATION_BUCKETS),
+    'sheets_response_bytes': ('histogram of approximate Sheets response payload sizes', SIZE_BUCKETS),
+    'sheets_wait_seconds': ('histogram of time spent waiting on quota or 429 backoff', DURATION_BUCKETS),
+    'render_seconds': ('histogram of time spent building result views', DURATION_BUCKETS),
+}
+
+# Entry point that caused the Sheets calls on this thread, e.g. 'search_handover'
+CALL_TAG = contextvars.ContextVar('call_tag', default=None)
+
+
+def tagged(function):
+    """Tag Sheets calls made inside function with its name; the outermost tagged caller wins"""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if CALL_TAG.get() is not None:
+            return function(*args, **kwargs)
+        token = CALL_TAG.set(function.__name__)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            CALL_TAG.reset(token)
+    return wrapper
+
+
+class RollingHistogram:
+    """Bucketed observations, both over the last `window` seconds and since start"""
+
+    SLOTS = 10
+
+    def __init__(self, buckets, window):
+        self.buckets = buckets
+        self.slot_seconds = window / self.SLOTS
+        # [slot number, bucket counts, sum], oldest first
+        self._slots = deque()
+        self.total_counts = [0] * (len(buckets) + 1)
+        self.total_sum = 0.0
+
+    def _expire(self, slot_number):
+        while self._slots and self._slots[0][0] <= slot_number - self.SLOTS:
+            self._slots.popleft()
+
+    def observe(self, value, now):
+        pos = bisect_left(self.buckets, value)
+        slot_number = int(now // self.slot_seconds)
+        self._expire(slot_number)
+        if not self._slots or self._slots[-1][0] != slot_number:
+            self._slots.append([slot_number, [0] * (len(self.buckets) + 1), 0.0])
+        slot = self._slots[-1]
+        slot[1][pos] += 1
+        slot[2] += value
+        self.total_counts[pos] += 1
+        self.total_sum += value
+
+    def window(self, now):
+        """(bucket counts, sum) over the rolling window"""
+        self._expire(int(now // self.slot_seconds))
+        counts = [0] * (len(self.buckets) + 1)
+        total = 0.0
+        for _, slot_counts, slot_sum in self._slots:
+            counts = [a + b for a, b in zip(counts, slot_counts)]
+            total += slot_sum
+        return counts, total
+
+    def quantile(self, counts, q):
+        """Estimate of the q-quantile from bucket counts, interpolating inside the bucket"""
+        rank = q * sum(counts)
+        seen = 0
+        for pos, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if pos == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[pos - 1] if pos else 0.0
+                return lower + (self.buckets[pos] - lower) * (rank - seen) / count
+            seen += count
+        return 0.0
+
+
+class PerfMetrics:
+    """Process-wide histograms of Sheets calls, quota waits and rendering, keyed by labels"""
+
+    LOG_FLUSH_SECONDS = 1.0
+
+    def __init__(self, window, log_path=None):
+        self.window = window
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        # (metric, ((label, value), ...)) -> RollingHistogram
+        self._series = {}
+        # Observations waiting for the log writer, so observe never touches the file
+        self._log_pending = []
+        if log_path:
+            threading.Thread(target=self._run_log, name='metrics-log', daemon=True).start()
+
+    def observe(self, metric, value, **labels):
+        key = (metric, tuple(sorted(labels.items())))
+        now = time.time()
+        with self._lock:
+            if key not in self._series:
+                self._series[key] = RollingHistogram(METRICS[metric][1], self.window)
+            self._series[key].observe(value, now)
+            if self.log_path:
+                self._log_pending.append((now, metric, value, labels))
+
+    def flush_log(self):
+        """Append every buffered observation to the log file in one write"""
+        with self._lock:
+            pending, self._log_pending = self._log_pending, []
+        if pending:
+            with open(self.log_path, 'a') as log:
+                log.write(''.join(json.dumps({'ts': round(now, 3), 'metric': metric, 'value': value, **labels}) + '\n'
+                                  for now, metric, value, labels in pending))
+
+    def _run_log(self):
+        while True:
+            time.sleep(self.LOG_FLUSH_SECONDS)
+            try:
+                self.flush_log()
+            except OSError:
+                # A full disk or a rotated-away directory shouldn't kill the writer
+                pass
+
+    def summary(self):
+        """Rolling-window rows: metric, labels, count, mean, p50, p95"""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for (metric, labels), histogram in sorted(self._series.items()):
+                counts, total = histogram.window(now)
+                count = sum(counts)
+                if not count:
+                    continue
+                rows.append({
+                    'metric': metric,
+                    **dict(labels),
+                    'count': count,
+                    'total': total,
+                    'mean': total / count,
+                    'p50': histogram.quantile(counts, 0.5),
+                    'p95': histogram.quantile(counts, 0.95),
+                })
+        return rows
+
+    def prometheus(self):
+        """All series since start in the Prometheus text exposition format"""
+        def label_text(labels, **extra):
+            pairs = [*labels, *extra.items()]
+            escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                       for _, value in pairs)
+            return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+        lines = []
+        with self._lock:
+            for metric, (help_text, buckets) in METRICS.items():
+                series = sorted((labels, histogram) for (name, labels), histogram in self._series.items()
+                                if name == metric)
+                if not series:
+                    continue
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip([*buckets, '+Inf'], histogram.total_counts):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{label_text(labels, le=bound)} {cumulative}")
+                    lines.append(f"{metric}_sum{label_text(labels)} {histogram.total_sum}")
+                    lines.append(f"{metric}_count{label_text(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """GET /metrics (Prometheus text) and /metrics.json (rolling summary)"""
+
+    def do_GET(self):
+        metrics = get_metrics()
+        if self.path == '/metrics':
+            body, content_type = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+        elif self.path == '/metrics.json':
+            body, content_type = json.dumps(metrics.summary()).encode(), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    """Single metrics registry for the whole server process; starts the endpoint if METRICS_PORT is set"""
+    metrics = PerfMetrics(METRICS_WINDOW_SECONDS, METRICS_LOG_PATH or None)
+    if METRICS_PORT:
+        server = http.server.ThreadingHTTPServer((METRICS_HOST, METRICS_PORT), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics-endpoint', daemon=True).start()
+    return metrics
+
+
+@contextmanager
+def render_timer(view):
+    """Record how long building a result view took (server side; the browser paints afterwards)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        get_metrics().observe('render_seconds', time.perf_counter() - started, view=view)
+
+# ============== REQUEST SCHEDULER ==============
+
+class TokenBucket:
+    """Token bucket sized so no 60s window ever exceeds per_minute requests"""
+
+    def __init__(self, per_minute):
+        # A burst of a fifth of the quota plus the refill over a minute adds up to exactly the quota
+        self.capacity = max(1.0, per_minute / 5)
+        self.rate = max(per_minute - self.capacity, 1.0) / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, floor):
+        """Seconds until a token can be taken without going below floor"""
+        return max(0.0, (floor + 1 - self.tokens) / self.rate)
+
+    def drain(self):
+        self.tokens = min(self.tokens, 0.0)
+
+
+def sampled_size(rows, row_size, sample=64):
+    """Size of every row, measured on an evenly spaced sample and scaled up"""
+    if not rows:
+        return 0
+    step = max(1, len(rows) // sample)
+    picked = rows[::step]
+    return round(sum(map(row_size, picked)) * len(rows) / len(picked))
+
+
+def values_row_size(row):
+    # Cell text plus its quotes and comma, plus the row's brackets
+    return sum(map(len, map(str, row))) + 3 * len(row) + 2
+
+
+def grid_row_size(row):
+    # {"key":"text"} for every cell and field, plus the row's wrapper
+    cells = row.get('values') or ()
+    return sum(len(key) + len(str(value)) + 6 for cell in cells for key, value in cell.items()) + 3 * len(cells) + 13
+
+
+def response_size(result):
+    """Approximate JSON size of a Sheets response, estimated from a sample of its rows instead of re-serializing it"""
+    if not isinstance(result, dict):
+        return 0
+    grids = [result] if 'values' in result else result.get('valueRanges') or []
+    sheets = result.get('sheets') or []
+    if not grids and not sheets:
+        # Updates and metadata without grid data are small enough to serialize
+        return len(json.dumps(result, separators=(',', ':')))
+    size = sum(sampled_size(grid.get('values') or [], values_row_size) for grid in grids)
+    for sheet in sheets:
+        for data in sheet.get('data') or ():
+            size += sampled_size(data.get('rowData') or [], grid_row_size)
+    return size
+
+
+def request_user(request):
+    """Stable, non-secret key for the user whose credentials a request carries"""
+    credentials = getattr(getattr(request, 'http', None), 'credentials', None)
+    secret = getattr(credentials, 'refresh_token', None) or getattr(credentials, 'token', None)
+    if not secret:
+        return 'default'
+    return hashlib.sha256(secret.encode()).hexdigest()[:12]
+
+
+class SheetsScheduler:
+    """Process-wide gate every Sheets request passes through
+
+    Reads and writes each draw from a per-project and a per-user token bucket.
+    A request waits while a higher-priority request of the same kind is
+    waiting, and background requests leave a fifth of each bucket for
+    operators. A 429 drains the buckets so every session slows down together,
+    and the request is retried with exponential backoff.
+    """
+
+    BACKGROUND_RESERVE = 0.2
+    BACKOFF_BASE_SECONDS = 1.0
+    BACKOFF_MAX_SECONDS = 32.0
+
+    def __init__(self, quotas, max_retries):
+        self.quotas = quotas
+        self.max_retries = max_retries
+        self._cond = threading.Condition()
+        self._project = {kind: TokenBucket(limits[0]) for kind, limits in quotas.items()}
+        self._users = {}
+        # waiter id -> [kind, priority, user, held up only by its own per-user bucket]
+        self._waiters = {}
+        self._waiter_ids = itertools.count()
+        self._stats = {'requests': 0, 'waits': 0, 'throttled': 0, 'retries': 0}
+
+    def _user_bucket(self, kind, user):
+        key = (kind, user)
+        if key not in self._users:
+            self._users[key] = TokenBucket(self.quotas[kind][1])
+        return self._users[key]
+
+    def acquire(self, kind, user, priority):
+        """Block until the request may be sent
+
+        A request yields to higher-priority waiters of its kind that compete for a bucket
+        it also needs: the project bucket, or its own user's. A waiter that is only held
+        up by another user's empty bucket doesn't stall anyone else.
+        """
+        with self._cond:
+            waiter_id = next(self._waiter_ids)
+            waiter = self._waiters[waiter_id] = [kind, priority, user, False]
+            waited = False
+            try:
+                buckets = [self._project[kind], self._user_bucket(kind, user)]
+                while True:
+                    now = time.monotonic()
+                    for bucket in buckets:
+                        bucket.refill(now)
+                    floors = [bucket.capacity * self.BACKGROUND_RESERVE if priority >= PRIORITY_BACKGROUND else 0.0
+                              for bucket in buckets]
+                    ready = [bucket.tokens >= floor + 1 for bucket, floor in zip(buckets, floors)]
+                    if waiter[3] != (not ready[1]):
+                        waiter[3] = not ready[1]
+                        self._cond.notify_all()
+                    ahead = any(other_kind == kind and other_priority < priority
+                                and (other_user == user or not own_bucket_only)
+                                for other_kind, other_priority, other_user, own_bucket_only in self._waiters.values())
+                    if not ahead and all(ready):
+                        for bucket in buckets:
+                            bucket.tokens -= 1
+                        self._stats['requests'] += 1
+                        return
+                    waited = True
+                    timeout = None if ahead else max(
+                        bucket.wait_time(floor) for bucket, floor in zip(buckets, floors)
+                    )
+                    self._cond.wait(timeout=timeout)
+            finally:
+                del self._waiters[waiter_id]
+                if waited:
+                    self._stats['waits'] += 1
+                self._cond.notify_all()
+
+    def throttled(self, kind, user):
+        """Sheets answered 429: stop everyone of this kind until the buckets refill"""
+        with self._cond:
+            self._stats['throttled'] += 1
+            self._project[kind].drain()
+            self._user_bucket(kind, user).drain()
+
+    def execute(self, request, kind, priority):
+        user = request_user(request)
+        metrics = get_metrics()
+        caller = CALL_TAG.get() or 'other'
+        method = getattr(request, 'methodId', None) or kind
+        for attempt in range(self.max_retries + 1):
+            started = time.monotonic()
+            self.acquire(kind, user, priority)
+            sent = time.monotonic()
+            metrics.observe('sheets_wait_seconds', sent - started, caller=caller, kind=kind, reason='quota')
+            try:
+                result = execute_threadsafe(request)
+            except HttpError as e:
+                metrics.observe('sheets_request_seconds', time.monotonic() - sent,
+                                caller=caller, method=method, status=e.resp.status)
+                if e.resp.status != 429 or attempt == self.max_retries:
+                    raise
+                self.throttled(kind, user)
+                with self._cond:
+                    self._stats['retries'] += 1
+                delay = min(self.BACKOFF_MAX_SECONDS, self.BACKOFF_BASE_SECONDS * 2 ** attempt)
+                delay *= random.uniform(0.5, 1.0)
+                metrics.observe('sheets_wait_seconds', delay, caller=caller, kind=kind, reason='backoff')
+                time.sleep(delay)
+                continue
+            except Exception:
+                # Transport failures (timeouts, dropped connections) have no HTTP status
+                metrics.observe('sheets_request_seconds', time.monotonic() - sent,
+                                caller=caller, method=method, status='error')
+                raise
+            metrics.observe('sheets_request_seconds', time.monotonic() - sent, caller=caller, method=method, status=200)
+            metrics.observe('sheets_response_bytes', response_size(result), caller=caller, method=method)
+            return result
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            for bucket in self._project.values():
+                bucket.refill(now)
+            return {
+                **self._stats,
+                'waiting': len(self._waiters),
+                'tokens': {kind: bucket.tokens for kind, bucket in self._project.items()},
+            }
+
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """Single request scheduler for the whole server process"""
+    return SheetsScheduler({'read': SHEETS_READ_QUOTA, 'write': SHEETS_WRITE_QUOTA}, SHEETS_MAX_RETRIES)
+
+
+def sheets_call(request, kind='read', priority=PRIORITY_READ):
+    """Execute a Sheets API request through the shared quota scheduler"""
+    return get_scheduler().execute(request, kind, priority)
+
+# ============== SEARCH INDEX ==============
+
+class TrigramIndex:
+    """Inverted trigram index answering "any cell contains term" over data rows"""
+
+    # Joins cells so a term can never match across two neighbouring cells
+    CELL_SEP = '\x00'
+
+    def __init__(self, rows):
+        self._lock = threading.Lock()
+        self._texts = []
+        self._postings = {}
+        for pos, row in enumerate(rows):
+            text = self._row_text(row)
+            self._texts.append(text)
+            for gram in self._grams(text):
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('I')
+                posting.append(pos)
+
+    @classmethod
+    def _row_text(cls, row):
+        return cls.CELL_SEP.join(str(cell).lower() for cell in row)
+
+    @classmethod
+    def _grams(cls, text):
+        return {gram for cell in text.split(cls.CELL_SEP)
+                for gram in (cell[i:i + 3] for i in range(len(cell) - 2))}
+
+    def __len__(self):
+        return len(self._texts)
+
+    def search(self, term):
+        """Positions (in row order) of rows with a cell containing term"""
+        term = term.lower()
+        with self._lock:
+            if len(term) < 3:
+                candidates = range(len(self._texts))
+            else:
+                # Every trigram of the term must occur in the row, so the rarest
+                # posting list is a complete candidate set; verify each candidate
+                candidates = None
+                for gram in self._grams(term):
+                    posting = self._postings.get(gram)
+                    if not posting:
+                        return []
+                    if candidates is None or len(posting) < len(candidates):
+                        candidates = posting
+            texts = self._texts
+            return [pos for pos in candidates if term in texts[pos]]
+
+    def update_row(self, pos, row):
+        """Re-index one row after its cells changed (or append it)"""
+        text = self._row_text(row)
+        with self._lock:
+            if pos >= len(self._texts):
+                self._texts.extend([''] * (pos + 1 - len(self._texts)))
+            old_grams = self._grams(self._texts[pos])
+            new_grams = self._grams(text)
+            self._texts[pos] = text
+            for gram in old_grams - new_grams:
+                posting = self._postings[gram]
+                del posting[bisect_left(posting, pos)]
+            for gram in new_grams - old_grams:
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('I')
+                insort(posting, pos)
+
+    def truncate(self, count):
+        """Drop rows from position count onwards"""
+        for pos in range(len(self._texts) - 1, count - 1, -1):
+            self.update_row(pos, [])
+        with self._lock:
+            del self._texts[count:]
+
+
+def normalize_key(value):
+    """Canonical form of an order/bundle ID as typed or scanned"""
+    return str(value).strip().lower()
+
+
+class KeyIndex:
+    """Hash index from normalized key cells (Order No, Bundle ID, ...) to data row positions"""
+
+    def __init__(self, rows, columns):
+        self._lock = threading.Lock()
+        self.columns = columns
+        self._positions = {}
+        self._row_keys = []
+        for pos, row in enumerate(rows):
+            self._add(pos, row)
+
+    def _cell_keys(self, row):
+        keys = set()
+        for col_idx in self.columns:
+            if col_idx < len(row):
+                key = normalize_key(row[col_idx])
+                if key:
+                    keys.add(key)
+        return keys
+
+    def _add(self, pos, row):
+        keys = self._cell_keys(row)
+        if pos >= len(self._row_keys):
+            self._row_keys.extend(set() for _ in range(pos + 1 - len(self._row_keys)))
+        self._row_keys[pos] = keys
+        for key in keys:
+            insort(self._positions.setdefault(key, []), pos)
+
+    def _remove(self, pos):
+        if pos >= len(self._row_keys):
+            return
+        for key in self._row_keys[pos]:
+            positions = self._positions[key]
+            del positions[bisect_left(positions, pos)]
+            if not positions:
+                del self._positions[key]
+        self._row_keys[pos] = set()
+
+    def lookup(self, value):
+        """Positions (in row order) of rows whose key cells equal value"""
+        with self._lock:
+            return list(self._positions.get(normalize_key(value), ()))
+
+    def update_row(self, pos, row):
+        with self._lock:
+            self._remove(pos)
+            self._add(pos, row)
+
+    def truncate(self, count):
+        with self._lock:
+            for pos in range(count, len(self._row_keys)):
+                self._remove(pos)
+            del self._row_keys[count:]
+
+
+def cell_tokens(value):
+    """What a field query clause can match in a cell: the whole normalized value and each word in it"""
+    value = normalize_key(value)
+    if not value:
+        return frozenset()
+    return frozenset(re.findall(r'[a-z0-9]+', value)) | {value}
+
+
+def tokens_match(tokens, value, prefix):
+    if prefix:
+        return any(token.startswith(value) for token in tokens)
+    return value in tokens
+
+
+class ColumnIndex:
+    """Per-column word index for field queries: exact (hash) and prefix (sorted) lookups"""
+
+    def __init__(self, rows, col_idx):
+        self._lock = threading.Lock()
+        self.col_idx = col_idx
+        # token -> sorted positions, and every token in sorted order for prefix ranges
+        self._postings = {}
+        self._row_tokens = []
+        for pos, row in enumerate(rows):
+            tokens = self._tokens_of(row)
+            self._row_tokens.append(tokens)
+            for token in tokens:
+                self._postings.setdefault(token, []).append(pos)
+        self._sorted_tokens = sorted(self._postings)
+
+    def _tokens_of(self, row):
+        return cell_tokens(row[self.col_idx]) if self.col_idx < len(row) else frozenset()
+
+    def _prefix_tokens(self, prefix):
+        start = bisect_left(self._sorted_tokens, prefix)
+        for token in itertools.islice(self._sorted_tokens, start, None):
+            if not token.startswith(prefix):
+                break
+            yield token
+
+    def estimate(self, value, prefix, limit=None):
+        """Number of matching rows (an upper bound for prefixes), counting no further than limit"""
+        with self._lock:
+            if not prefix:
+                return len(self._postings.get(value, ()))
+            total = 0
+            for token in self._prefix_tokens(value):
+                total += len(self._postings[token])
+                if limit is not None and total > limit:
+                    break
+            return total
+
+    def positions(self, value, prefix):
+        """Sorted positions of rows whose cell has a token equal to (or starting with) value"""
+        with self._lock:
+            if not prefix:
+                return list(self._postings.get(value, ()))
+            found = set()
+            for token in self._prefix_tokens(value):
+                found.update(self._postings[token])
+            return sorted(found)
+
+    def row_matches(self, pos, value, prefix):
+        with self._lock:
+            return pos < len(self._row_tokens) and tokens_match(self._row_tokens[pos], value, prefix)
+
+    def _remove(self, pos):
+        if pos >= len(self._row_tokens):
+            return
+        for token in self._row_tokens[pos]:
+            positions = self._postings[token]
+            del positions[bisect_left(positions, pos)]
+            if not positions:
+                del self._postings[token]
+                del self._sorted_tokens[bisect_left(self._sorted_tokens, token)]
+        self._row_tokens[pos] = frozenset()
+
+    def update_row(self, pos, row):
+        with self._lock:
+            self._remove(pos)
+            if pos >= len(self._row_tokens):
+                self._row_tokens.extend(frozenset() for _ in range(pos + 1 - len(self._row_tokens)))
+            tokens = self._row_tokens[pos] = self._tokens_of(row)
+            for token in tokens:
+                if token not in self._postings:
+                    self._postings[token] = []
+                    insort(self._sorted_tokens, token)
+                insort(self._postings[token], pos)
+
+    def truncate(self, count):
+        with self._lock:
+            for pos in range(count, len(self._row_tokens)):
+                self._remove(pos)
+            del self._row_tokens[count:]
+
+
+# field:value, field:value* or field:"two words"; fields start with a letter so times like 10:30 stay free text
+QUERY_CLAUSE = re.compile(r'(?<!\S)([A-Za-z][\w/]*):(?:"([^"]*)"|(\S+))')
+
+
+def parse_field_query(text):
+    """Split a search box entry into ([(field, value, prefix)], free text)"""
+    clauses = []
+    for match in QUERY_CLAUSE.finditer(text):
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        prefix = value.endswith('*')
+        value = normalize_key(value.rstrip('*'))
+        if value:
+            clauses.append((match.group(1).lower(), value, prefix))
+    return clauses, QUERY_CLAUSE.sub(' ', text).strip()
+
+
+def resolve_query_fields(clauses, headers):
+    """Swap clause field names for column indexes; ValueError names an unknown field"""
+    normalized = [normalize_key(header) for header in headers]
+    resolved = []
+    for field, value, prefix in clauses:
+        col_idx = None
+        for name in QUERY_FIELD_ALIASES.get(field, []) + [field]:
+            if name in normalized:
+                col_idx = normalized.index(name)
+                break
+        if col_idx is None:
+            col_idx = next((idx for idx, header in enumerate(normalized) if field in header), None)
+        if col_idx is None:
+            fields = ', '.join(sorted(set(QUERY_FIELD_ALIASES) | {header for header in normalized if header}))
+            raise ValueError(f"Unknown field '{field}'. Try one of: {fields}")
+        resolved.append((col_idx, value, prefix))
+    return resolved
+
+
+def row_matches_query(row, resolved, free_text):
+    """Whether one row satisfies every resolved clause and contains the free text"""
+    for col_idx, value, prefix in resolved:
+        if not tokens_match(cell_tokens(row[col_idx]) if col_idx < len(row) else (), value, prefix):
+            return False
+    term = free_text.lower()
+    return not term or any(term in str(cell).lower() for cell in row)
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_sheet_date(value):
+    """Day ordinal of a sheet date cell (time of day ignored), or None if it isn't a date"""
+    value = str(value).strip()
+    for candidate in (value, value.split(' ')[0]):
+        for date_format in SHEET_DATE_FORMATS:
+            try:
+                return datetime.strptime(candidate, date_format).toordinal()
+            except ValueError:
+                pass
+    return None
+
+
+def pending_sort_key(sort, pos, vendor, ordinal):
+    """Sort key of a pending row for one of PENDING_SORTS; undated rows always sort last"""
+    if sort == 'Oldest first':
+        return (ordinal is None, ordinal or 0, pos)
+    if sort == 'Newest first':
+        return (ordinal is None, -(ordinal or 0), pos)
+    if sort == 'Vendor':
+        return (vendor, pos)
+    return (pos,)
+
+
+class PendingIndex:
+    """Data rows still waiting for handover, kept in every sort order that has been asked for
+
+    Rows enter and leave as their status changes through update_row, so marking a
+    handover or a snapshot reload only touches the rows involved.
+    """
+
+    def __init__(self, rows, status_col, vendor_col, date_col, done_statuses):
+        self._lock = threading.Lock()
+        self.status_col = status_col
+        self.vendor_col = vendor_col
+        self.date_col = date_col
+        self.done_statuses = frozenset(done_statuses)
+        # pos -> (vendor, date ordinal) of every pending row
+        self._keys = {}
+        # sort -> sorted list of sort keys, each ending in pos
+        self._orders = {}
+        for pos, row in enumerate(rows):
+            self._add(pos, row)
+
+    @staticmethod
+    def _cell(row, col_idx):
+        return str(row[col_idx]) if col_idx is not None and col_idx < len(row) else ''
+
+    def _add(self, pos, row):
+        if not any(str(cell).strip() for cell in row):
+            # Blank rows are spacing in the sheet, not orders
+            return
+        if self._cell(row, self.status_col).strip().lower() in self.done_statuses:
+            return
+        vendor = self._cell(row, self.vendor_col).strip().lower()
+        ordinal = parse_sheet_date(self._cell(row, self.date_col)) if self.date_col is not None else None
+        self._keys[pos] = (vendor, ordinal)
+        for sort, order in self._orders.items():
+            insort(order, pending_sort_key(sort, pos, vendor, ordinal))
+
+    def _remove(self, pos):
+        keys = self._keys.pop(pos, None)
+        if keys is None:
+            return
+        for sort, order in self._orders.items():
+            del order[bisect_left(order, pending_sort_key(sort, pos, *keys))]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def page(self, sort, allowed=None, offset=0, limit=None):
+        """(count, positions) of pending rows in sort order, optionally only those in allowed"""
+        with self._lock:
+            order = self._orders.get(sort)
+            if order is None:
+                order = self._orders[sort] = sorted(
+                    pending_sort_key(sort, pos, *keys) for pos, keys in self._keys.items()
+                )
+            end = None if limit is None else offset + limit
+            if allowed is None:
+                return len(order), [key[-1] for key in order[offset:end]]
+            positions = [key[-1] for key in order if key[-1] in allowed]
+            return len(positions), positions[offset:end]
+
+    def update_row(self, pos, row):
+        with self._lock:
+            self._remove(pos)
+            self._add(pos, row)
+
+    def truncate(self, count):
+        with self._lock:
+            for pos in [pos for pos in self._keys if pos >= count]:
+                self._remove(pos)
+
+
+def linear_search(rows, search_term):
+    """Reference scan the index replaces; kept for benchmarks"""
+    term = search_term.lower()
+    return [pos for pos, row in enumerate(rows)
+            if any(term in str(cell).lower() for cell in row)]
+
+# ============== ROW STORE ==============
+
+class ColumnarRows:
+    """Compact columnar copy of a sheet range, shared read-only by every session
+
+    Each sheet column is dictionary-encoded: its distinct values are kept once (interned,
+    so reloads and other columns share them) and every row costs a 4-byte code per column
+    instead of a list of its own. rows[pos] rebuilds a row as a list, trimmed of trailing
+    blanks exactly as Sheets returned it. Only the snapshot cache writes (via rows[pos] = row).
+    """
+
+    def __init__(self, rows):
+        # Per column: code -> value (code 0 is ''), value -> code, and one code per row
+        self._values = []
+        self._lookup = []
+        self._codes = []
+        self._widths = array('I')
+        self._value_bytes = 0
+        for row in rows:
+            for col_idx, value in enumerate(row):
+                code = self._code(col_idx, value)
+                self._codes[col_idx].append(code)
+            for col_idx in range(len(row), len(self._codes)):
+                self._codes[col_idx].append(0)
+            self._widths.append(len(row))
+        # The value -> code maps are as big as the values themselves and only writes need them
+        self._lookup = [None] * len(self._codes)
+
+    def _code(self, col_idx, value):
+        while col_idx >= len(self._codes):
+            # A column first seen now reads as blank in every earlier row
+            self._values.append([''])
+            self._lookup.append({'': 0})
+            self._codes.append(array('I', bytes(4 * len(self._widths))))
+        lookup = self._lookup[col_idx]
+        if lookup is None:
+            values = self._values[col_idx]
+            lookup = self._lookup[col_idx] = {value: code for code, value in enumerate(values)}
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self._values[col_idx])
+            self._values[col_idx].append(sys.intern(value) if type(value) is str else value)
+            self._value_bytes += sys.getsizeof(value) + 8
+        return code
+
+    def _store(self, pos, row):
+        for col_idx, value in enumerate(row):
+            # Unchanged cells skip the lookup, so a status patch only rebuilds that column's map
+            if col_idx < self._widths[pos] and self.cell(pos, col_idx) == value:
+                continue
+            code = self._code(col_idx, value)
+            self._codes[col_idx][pos] = code
+        for col_idx in range(len(row), self._widths[pos]):
+            self._codes[col_idx][pos] = 0
+        self._widths[pos] = len(row)
+
+    def __len__(self):
+        return len(self._widths)
+
+    def cell(self, pos, col_idx):
+        """One cell without building the row; '' past the row's end"""
+        if col_idx >= self._widths[pos]:
+            return ''
+        return self._values[col_idx][self._codes[col_idx][pos]]
+
+    def row(self, pos):
+        return [self._values[col_idx][self._codes[col_idx][pos]] for col_idx in range(self._widths[pos])]
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self.row(p) for p in range(*pos.indices(len(self)))]
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        return self.row(pos)
+
+    def __setitem__(self, pos, row):
+        self._store(pos, row)
+
+    def rows(self, start=0):
+        """Iterate rows from position start without copying the whole range"""
+        # Decode column-wise and zip back into rows: much cheaper than row(pos) per position
+        columns = [map(values.__getitem__, codes[start:]) for values, codes in zip(self._values, self._codes)]
+        if not columns:
+            yield from ([] for _ in range(start, len(self)))
+            return
+        for width, cells in zip(self._widths[start:], zip(*columns)):
+            yield list(cells[:width])
+
+    def __iter__(self):
+        return self.rows()
+
+    def nbytes(self):
+        """Approximate memory held by the store: code arrays plus the distinct values (and their slots)"""
+        arrays = [self._widths, *self._codes]
+        return self._value_bytes + sum(codes.buffer_info()[1] * codes.itemsize for codes in arrays)
+
+
+class RowView(Mapping):
+    """Read-only header -> cell view of one stored row, resolved on access
+
+    Search results hand these out instead of building a padded copy and a dict per match;
+    missing cells read as '' and duplicate headers resolve to their last column, as
+    dict(zip(headers, row)) did. extra adds computed fields such as a pending row's age.
+    """
+
+    __slots__ = ('_rows', '_columns', '_pos', '_extra')
+
+    def __init__(self, rows, columns, pos, extra=None):
+        self._rows = rows
+        self._columns = columns
+        self._pos = pos
+        self._extra = extra
+
+    def __getitem__(self, header):
+        if self._extra and header in self._extra:
+            return self._extra[header]
+        return self._rows.cell(self._pos, self._columns[header])
+
+    def __iter__(self):
+        yield from self._columns
+        if self._extra:
+            yield from (header for header in self._extra if header not in self._columns)
+
+    def __len__(self):
+        return len(self._columns) + sum(1 for header in self._extra or () if header not in self._columns)
+
+    def __repr__(self):
+        return f"RowView({dict(self)!r})"
+
+# ============== SNAPSHOT CACHE ==============
+
+class SheetSnapshot:
+    """One cached read of a sheet range; values[0] is sheet row first_row"""
+
+    # Past this fraction of changed rows, patching the old indexes costs more than
+    # rebuilding them (a row inserted near the top shifts every row below it)
+    INHERIT_MAX_CHANGED = 0.1
+
+    def __init__(self, values, first_row):
+        self.values = ColumnarRows(values)
+        self.first_row = first_row
+        self._columns = None
+        self.loaded_at = time.monotonic()
+        self._indexes = {}
+        # Guards _indexes, _building and _forward, and every write to values; held only briefly
+        self._index_lock = threading.Lock()
+        # One index build at a time, outside _index_lock so writes never wait for a build
+        self._build_lock = threading.Lock()
+        # Index name -> positions written while it was being built, or None once the header changed
+        self._building = {}
+        # Writes that reached this snapshot after its replacement took over its indexes
+        self._forward = None
+
+    def age(self):
+        return time.monotonic() - self.loaded_at
+
+    def _index(self, name, build):
+        """Index over the data rows (values[1:]), built once per snapshot on first use
+
+        The build reads a copy of the rows taken when it starts; rows written while
+        it runs are re-indexed from their stored value before the index is registered.
+        """
+        index = self._indexes.get(name)
+        if index is not None:
+            return index
+        with self._build_lock:
+            with self._index_lock:
+                index = self._indexes.get(name)
+                if index is not None:
+                    return index
+                self._building[name] = set()
+                rows = self.values.rows(1)
+            index = build(rows)
+            with self._index_lock:
+                written = self._building.pop(name)
+                if written is None:
+                    # The header changed mid-build: good for this caller, not worth keeping
+                    return index
+                for pos in sorted(written):
+                    index.update_row(pos - 1, self.values.row(pos))
+                self._indexes[name] = index
+        return index
+
+    def columns(self):
+        """Header -> column index for row views, last column winning like dict(zip(headers, row))"""
+        columns = self._columns
+        if columns is None:
+            headers = self.values[0] if self.values else []
+            columns = self._columns = {header: col_idx for col_idx, header in enumerate(headers)}
+        return columns
+
+    def row_view(self, pos, extra=None):
+        """Lazy view of data row pos (values[pos + 1])"""
+        return RowView(self.values, self.columns(), pos + 1, extra)
+
+    def matches(self, positions):
+        """Search-result entries for data-row positions; data is a RowView, not a copy"""
+        data_start = self.first_row + 1
+        return [{'row_index': pos + data_start, 'data': self.row_view(pos)} for pos in positions]
+
+    def search_index(self):
+        """Trigram index for "any cell contains" search"""
+        return self._index('trigram', TrigramIndex)
+
+    def key_index(self, columns):
+        """Exact-match index over the given key columns"""
+        columns = tuple(columns)
+        return self._index(('keys', columns), lambda rows: KeyIndex(rows, columns))
+
+    def pending_index(self, status_col, vendor_col, date_col, done_statuses):
+        """Maintained set of rows whose status is not one of done_statuses"""
+        done_statuses = tuple(done_statuses)
+        return self._index(('pending', status_col, vendor_col, date_col, done_statuses),
+                           lambda rows: PendingIndex(rows, status_col, vendor_col, date_col, done_statuses))
+
+    def column_index(self, col_idx):
+        """Word index of one column for field queries"""
+        return self._index(('column', col_idx), lambda rows: ColumnIndex(rows, col_idx))
+
+    def query(self, search_term):
+        """Data-row positions matching a search box entry: field:value clauses if it has any, else substring
+
+        The planner estimates every clause from its column index and evaluates the most
+        selective one through the index; the other clauses and any free text only check
+        the rows it returned.
+        """
+        clauses, free_text = parse_field_query(search_term)
+        if not clauses or not self.values:
+            return self.search_index().search(search_term)
+        resolved = resolve_query_fields(clauses, self.values[0])
+        planned = []
+        best = None
+        for col_idx, value, prefix in resolved:
+            index = self.column_index(col_idx)
+            estimate = index.estimate(value, prefix, best)
+            best = estimate if best is None else min(best, estimate)
+            planned.append((estimate, index, value, prefix))
+        planned.sort(key=lambda clause: clause[0])
+        _, index, value, prefix = planned[0]
+        positions = index.positions(value, prefix)
+        for _, index, value, prefix in planned[1:]:
+            positions = [pos for pos in positions if index.row_matches(pos, value, prefix)]
+        if free_text:
+            term = free_text.lower()
+            rows = self.values
+            positions = [pos for pos in positions if any(term in str(cell).lower() for cell in rows[pos + 1])]
+        return positions
+
+    def inherit_indexes(self, previous):
+        """Take over the indexes of the snapshot this one replaces, re-indexing only changed rows
+
+        Runs before this snapshot is published; from then on writes to the previous
+        snapshot are kept for take_writes. When too many rows changed the indexes are
+        left behind instead, and rebuilt lazily on first use, outside the cache's
+        single-flight lock.
+        """
+        with previous._index_lock:
+            previous._forward = []
+            indexes = previous._indexes
+            if not indexes or not previous.values or not self.values or previous.values[0] != self.values[0]:
+                return
+            # The old snapshot rebuilds its own indexes if anyone still searches it
+            previous._indexes = {}
+        # A write landing during the comparison is replayed by take_writes, which fixes its row either way
+        old_rows, new_rows = previous.values, self.values
+        limit = int(len(new_rows) * self.INHERIT_MAX_CHANGED)
+        changed = []
+        for pos in range(1, len(new_rows)):
+            if pos >= len(old_rows) or old_rows.row(pos) != new_rows.row(pos):
+                changed.append(pos)
+                if len(changed) > limit:
+                    return
+        for index in indexes.values():
+            for pos in changed:
+                index.update_row(pos - 1, new_rows.row(pos))
+            if len(old_rows) > len(new_rows):
+                index.truncate(len(new_rows) - 1)
+        with self._index_lock:
+            self._indexes = indexes
+
+    def take_writes(self, previous):
+        """Replay writes that reached the previous snapshot since inherit_indexes; call under the cache lock"""
+        with previous._index_lock:
+            writes, previous._forward = previous._forward or [], None
+        for pos, cells in writes:
+            if pos < len(self.values):
+                row = self.values.row(pos)
+                for col_idx, value in cells.items():
+                    if col_idx >= len(row):
+                        row.extend([''] * (col_idx + 1 - len(row)))
+                    row[col_idx] = value
+                self.replace_row(pos, row)
+
+    def replace_row(self, pos, row):
+        """Store a changed row and keep the indexes, and any being built, in step"""
+        with self._index_lock:
+            if self._forward is not None:
+                # Only the cells this write changed, so the newer snapshot keeps its other cells
+                old = self.values.row(pos) if pos < len(self.values) else []
+                self._forward.append((pos, {col_idx: value for col_idx, value in enumerate(row)
+                                            if col_idx >= len(old) or old[col_idx] != value}))
+            self.values[pos] = row
+            if pos == 0:
+                # Header changed, index positions (and row views' columns) are no longer trustworthy
+                self._indexes = {}
+                self._building = dict.fromkeys(self._building)
+                self._columns = None
+                return
+            for index in self._indexes.values():
+                index.update_row(pos - 1, row)
+            for written in self._building.values():
+                if written is not None:
+                    written.add(pos)
+
+
+class SheetSnapshotCache:
+    """Process-wide TTL cache of sheet range reads, shared by all sessions"""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+        self._stats = {'hits': 0, 'misses': 0, 'errors': 0, 'patches': 0, 'invalidations': 0}
+
+    def _fresh_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry.age() < self.ttl:
+            return entry
+        return None
+
+    def get(self, spreadsheet_id, range_name, loader):
+        """Return the snapshot for a range, calling loader() at most once per expiry"""
+        key = (spreadsheet_id, range_name)
+        with self._lock:
+            entry = self._fresh_entry(key)
+            if entry is not None:
+                self._stats['hits'] += 1
+                return entry
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        
+        # Single-flight: the first session loads, the others wait and reuse its result
+        with key_lock:
+            with self._lock:
+                entry = self._fresh_entry(key)
+                if entry is not None:
+                    self._stats['hits'] += 1
+                    return entry
+                self._stats['misses'] += 1
+            try:
+                values = loader()
+            except Exception:
+                with self._lock:
+                    self._stats['errors'] += 1
+                raise
+            entry = SheetSnapshot(values, range_start_row(range_name))
+            with self._lock:
+                previous = self._entries.get(key)
+            if previous is not None:
+                # Before publishing, so no search builds an index inherit_indexes would replace
+                entry.inherit_indexes(previous)
+            with self._lock:
+                current = self._entries.get(key)
+                self._entries[key] = entry
+                # patch_cell writes under this lock, so none can land on current after this
+                if current is not None:
+                    entry.take_writes(current)
+            return entry
+
+    def peek(self, spreadsheet_id, range_name):
+        """The cached snapshot for a range however old it is, or None; never loads"""
+        with self._lock:
+            return self._entries.get((spreadsheet_id, range_name))
+
+    def _tab_entries(self, spreadsheet_id, tab):
+        prefix = f"'{tab}'!"
+        return [(key, entry) for key, entry in self._entries.items()
+                if key[0] == spreadsheet_id and key[1].startswith(prefix)]
+
+    def patch_cell(self, spreadsheet_id, tab, row_index, col_idx, value):
+        """Apply a successful write to every cached range of the tab that covers the row"""
+        with self._lock:
+            for key, entry in self._tab_entries(spreadsheet_id, tab):
+                pos = row_index - entry.first_row
+                if not 0 <= pos < len(entry.values):
+                    # Row is outside what we loaded, fetch it fresh next time
+                    del self._entries[key]
+                    self._stats['invalidations'] += 1
+                    continue
+                row = list(entry.values[pos])
+                if col_idx >= len(row):
+                    row.extend([''] * (col_idx + 1 - len(row)))
+                row[col_idx] = value
+                entry.replace_row(pos, row)
+                self._stats['patches'] += 1
+
+    def invalidate(self, spreadsheet_id, tab=None):
+        """Drop cached ranges of a spreadsheet (or just one tab of it)"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == spreadsheet_id]
+            if tab is not None:
+                keys = [key for key, _ in self._tab_entries(spreadsheet_id, tab)]
+            for key in keys:
+                del self._entries[key]
+            self._stats['invalidations'] += len(keys)
+
+    def stats(self):
+        """Hit/miss counters plus age and size of every cached range"""
+        with self._lock:
+            total = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / total if total else 0.0,
+                'ttl': self.ttl,
+                'entries': [
+                    {'range': key[1], 'rows': len(entry.values), 'bytes': entry.values.nbytes(), 'age': entry.age()}
+                    for key, entry in self._entries.items()
+                ],
+            }
+
+
+def range_start_row(range_name):
+    """First sheet row of an A1 range like 'Tab'!A3:Z1000 or 'Tab'!A3"""
+    match = re.search(r"!\$?[A-Z]*\$?(\d+)", range_name)
+    return int(match.group(1)) if match else 1
+
+
+@st.cache_resource(show_spinner=False)
+def get_snapshot_cache():
+    """Single snapshot cache for the whole server process"""
+    return SheetSnapshotCache(SNAPSHOT_TTL_SECONDS)
+
+
+def tab_range(tab, header_row):
+    """Cache key range of a tab read from its header row down"""
+    # 'Tab'!A3 stands for "A3 to the end of the grid"; the paged reader finds the real size
+    return f"'{tab}'!A{header_row}"
+
+
+def read_tab(service, spreadsheet_id, tab, header_row):
+    """Read a whole tab from its header row down through the shared snapshot cache"""
+    return get_snapshot_cache().get(
+        spreadsheet_id,
+        tab_range(tab, header_row),
+        lambda: list(iter_sheet_rows(service, spreadsheet_id, tab, header_row))
+    )
+
+# ============== SHEET METADATA ==============
+
+class SheetMetadata:
+    """sheetId, grid size and header row of one tab"""
+
+    def __init__(self, sheet_id, row_count, col_count, header_row, headers):
+        self.sheet_id = sheet_id
+        self.row_count = row_count
+        self.col_count = col_count
+        self.header_row = header_row
+        self.headers = headers
+        self.columns = {header: idx for idx, header in enumerate(headers)}
+
+
+def load_sheet_metadata(service, spreadsheet_id, tab, header_row, priority=PRIORITY_READ):
+    """Fetch sheetId, grid size and headers of a tab in a single request"""
+    spreadsheet = sheets_call(service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        ranges=[f"'{tab}'!{header_row}:{header_row}"],
+        includeGridData=True,
+        fields='sheets(properties(sheetId,title,gridProperties),data(rowData(values(formattedValue))))'
+    ), priority=priority)
+    for sheet in spreadsheet.get('sheets', []):
+        properties = sheet['properties']
+        if properties['title'] != tab:
+            continue
+        grid = properties.get('gridProperties', {})
+        row_data = (sheet.get('data') or [{}])[0].get('rowData') or [{}]
+        headers = [cell.get('formattedValue', '') for cell in row_data[0].get('values', [])]
+        while headers and not headers[-1]:
+            headers.pop()
+        return SheetMetadata(
+            properties['sheetId'],
+            grid.get('rowCount', 1000),
+            grid.get('columnCount', 26),
+            header_row,
+            headers
+        )
+    raise ValueError(f"Tab '{tab}' not found in spreadsheet")
+
+
+class SheetMetadataCache:
+    """Process-wide cache of tab metadata so writes don't re-discover sheetId and headers"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.header_changes = 0
+
+    def get(self, service, spreadsheet_id, tab, header_row, refresh=False, priority=PRIORITY_READ):
+        key = (spreadsheet_id, tab)
+        if not refresh:
+            with self._lock:
+                metadata = self._entries.get(key)
+            if metadata is not None and metadata.header_row == header_row:
+                return metadata
+        metadata = load_sheet_metadata(service, spreadsheet_id, tab, header_row, priority)
+        with self._lock:
+            previous = self._entries.get(key)
+            self._entries[key] = metadata
+        if previous is not None and previous.headers != metadata.headers:
+            # Columns moved: cached rows no longer line up with the header map
+            self.header_changes += 1
+            get_snapshot_cache().invalidate(spreadsheet_id, tab)
+        return metadata
+
+    def invalidate(self, spreadsheet_id, tab):
+        with self._lock:
+            self._entries.pop((spreadsheet_id, tab), None)
+
+
+@st.cache_resource(show_spinner=False)
+def get_metadata_cache():
+    """Single metadata cache for the whole server process"""
+    return SheetMetadataCache()
+
+
+def find_handover_column(headers):
+    """Index of the Handedover Status column, or None"""
+    for idx, header in enumerate(headers):
+        if 'handedover' in header.lower() or 'handed' in header.lower():
+            return idx
+    return None
+
+
+def find_order_column(headers):
+    """Index of the Order No column, or None"""
+    for idx, header in enumerate(headers):
+        if header.strip().lower() == 'order no':
+            return idx
+    return None
+
+
+def find_handover_key_columns(headers):
+    """Columns a scanned handover code is matched against: Order No"""
+    order_col_idx = find_order_column(headers)
+    return [] if order_col_idx is None else [order_col_idx]
+
+
+def find_bundling_key_columns(headers):
+    """Columns a scanned bundling code is matched against: Fleek/Order ID and Bundle ID"""
+    return [idx for idx, header in enumerate(headers)
+            if header.strip().lower() in ('fleek/order id', 'bundle id')]
+
+
+def find_fleek_id_column(headers):
+    """Index of the Fleek/Order ID column, or None"""
+    for idx, header in enumerate(headers):
+        if header.strip().lower() == 'fleek/order id':
+            return idx
+    return None
+
+
+def find_vendor_column(headers):
+    """Index of the Vendor column, or None"""
+    for idx, header in enumerate(headers):
+        if 'vendor' in header.lower():
+            return idx
+    return None
+
+
+def find_date_column(headers):
+    """Index of the first Date column, or None"""
+    for idx, header in enumerate(headers):
+        if 'date' in header.lower():
+            return idx
+    return None
+
+
+def find_packing_column(headers):
+    """Index of the Packing Status column, or None"""
+    for idx, header in enumerate(headers):
+        if 'packing' in header.lower() and 'status' in header.lower():
+            return idx
+    return None
+
+
+# Per stage: the column identifying an order, and its status column
+STAGE_COLUMNS = {
+    'Handover': (find_order_column, find_handover_column),
+    'Bundling': (find_fleek_id_column, find_packing_column),
+}
+
+
+def status_cell_request(sheet_id, row_index, col_idx, value, note_text):
+    """updateCells request setting a cell's value and note together"""
+    return {
+        'updateCells': {
+            'range': {
+                'sheetId': sheet_id,
+                'startRowIndex': row_index - 1,
+                'endRowIndex': row_index,
+                'startColumnIndex': col_idx,
+                'endColumnIndex': col_idx + 1
+            },
+            'rows': [{
+                'values': [{
+                    'userEnteredValue': {'stringValue': value},
+                    'note': note_text
+                }]
+            }],
+            'fields': 'userEnteredValue,note'
+        }
+    }
+
+
+def cached_row_key(spreadsheet_id, tab, header_row, find_key_column, row_index):
+    """Identity cell (e.g. Order No) of a row as the cached snapshot has it, or None if not cached"""
+    if find_key_column is None:
+        return None
+    entry = get_snapshot_cache().peek(spreadsheet_id, tab_range(tab, header_row))
+    if entry is None or not entry.values:
+        return None
+    key_col = find_key_column(entry.values[0])
+    pos = row_index - entry.first_row
+    if key_col is None or not 0 < pos < len(entry.values):
+        return None
+    return entry.values.cell(pos, key_col) or None
+
+
+def row_spans(row_indexes, gap):
+    """Sorted (low, high) runs covering row_indexes, merging rows at most gap apart"""
+    spans = []
+    for row_index in sorted(row_indexes):
+        if spans and row_index - spans[-1][1] <= gap:
+            spans[-1][1] = row_index
+        else:
+            spans.append([row_index, row_index])
+    return [tuple(span) for span in spans]
+
+
+def verify_rows(service, spreadsheet_id, tab, header_row, headers, key_col, cells):
+    """Check a chunk against the sheet just before writing it
+
+    Returns None if the header row no longer matches headers (columns inserted,
+    deleted or renamed), else where each keyed cell's row is now: {row_index:
+    current row_index, or None if its key is gone}. One batchGet reads the header
+    row together with just the key cells being written (neighbouring rows share a
+    range), however far apart they are. Only when some rows have moved (inserted,
+    deleted or sorted since the search) is the whole key column read to find them
+    again. A key found more than once can't be placed safely and resolves to None too.
+    """
+    keyed = {row_index: normalize_key(expected) for row_index, _, _, expected in cells
+             if expected} if key_col is not None else {}
+    letter = column_letter(key_col) if keyed else None
+    spans = [None] + row_spans(keyed, VERIFY_RANGE_GAP)
+    ranges = [f"'{tab}'!{header_row}:{header_row}"] + [
+        f"'{tab}'!{letter}{low}:{letter}{high}" for low, high in spans[1:]]
+    found = {}
+    for start in range(0, len(ranges), VERIFY_RANGES_PER_CALL):
+        value_ranges = sheets_call(service.spreadsheets().values().batchGet(
+            spreadsheetId=spreadsheet_id, ranges=ranges[start:start + VERIFY_RANGES_PER_CALL]
+        ), priority=PRIORITY_WRITE).get('valueRanges', [])
+        for span, value_range in zip(spans[start:start + VERIFY_RANGES_PER_CALL], value_ranges):
+            rows = value_range.get('values', [])
+            if span is None:
+                if (rows[0] if rows else []) != headers:
+                    return None
+                continue
+            for offset, row in enumerate(rows):
+                if row:
+                    found[span[0] + offset] = normalize_key(row[0])
+    current = {row_index: row_index for row_index, key in keyed.items() if found.get(row_index) == key}
+    moved = [row_index for row_index in keyed if row_index not in current]
+    if moved:
+        column = sheets_call(service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id, range=f"'{tab}'!{letter}{header_row + 1}:{letter}"
+        ), priority=PRIORITY_WRITE).get('values', [])
+        locations = {}
+        for offset, row in enumerate(column):
+            if row:
+                locations.setdefault(normalize_key(row[0]), []).append(header_row + 1 + offset)
+        for row_index in moved:
+            found = locations.get(keyed[row_index], [])
+            current[row_index] = found[0] if len(found) == 1 else None
+    return current
+
+
+def write_status_cells(service, spreadsheet_id, tab, header_row, find_column, cells, find_key_column=None):
+    """Write (row_index, value, note_text, expected_key) status cells in chunked batchUpdates
+
+    Returns the status column (None if the tab has none), a dict mapping each
+    row_index to None on success or to the error that failed it, and a dict of
+    rows that had moved: {row_index: row the value actually went to}.
+    With find_key_column, a cell whose expected_key (the Order No the operator
+    saw) is no longer in its row is re-resolved before writing, so a sorted or
+    shifted sheet never gets the status of the wrong order.
+    Uses cached metadata, checked against the live header row in the same read
+    that verifies the keys, so each chunk is two round trips (three when rows
+    moved). If the headers changed the metadata is refreshed and the columns
+    re-resolved before anything is written; if a write fails the metadata is
+    refreshed too, and the chunk is retried once when the sheetId or status
+    column turned out to be stale.
+    """
+    metadata_cache = get_metadata_cache()
+    metadata = metadata_cache.get(service, spreadsheet_id, tab, header_row)
+    col_idx = find_column(metadata.headers)
+    if col_idx is None:
+        return None, {}, {}
+    
+    results = {}
+    moved = {}
+    for start in range(0, len(cells), BATCH_WRITE_CHUNK):
+        chunk = cells[start:start + BATCH_WRITE_CHUNK]
+        for attempt in range(2):
+            try:
+                key_col = find_key_column(metadata.headers) if find_key_column else None
+                targets = verify_rows(service, spreadsheet_id, tab, header_row, metadata.headers, key_col, chunk)
+                if targets is None:
+                    # Columns moved since the metadata was read: the cached status column
+                    # could now be another column entirely, so resolve it again first
+                    metadata = metadata_cache.get(service, spreadsheet_id, tab, header_row, refresh=True)
+                    col_idx = find_column(metadata.headers)
+                    if attempt == 0 and col_idx is not None:
+                        continue
+                    error = LookupError("The sheet's columns changed while writing; nothing was written")
+                    for row_index, _, _, _ in cells[start:]:
+                        results[row_index] = error
+                    return col_idx, results, moved
+                writes = []
+                for row_index, value, note_text, expected in chunk:
+                    target = targets.get(row_index, row_index)
+                    if target is None:
+                        results[row_index] = LookupError(
+                            f"'{expected}' is no longer at row {row_index} and couldn't be found again")
+                    else:
+                        writes.append((row_index, target, value, note_text, expected))
+                if writes:
+                    sheets_call(service.spreadsheets().batchUpdate(
+                        spreadsheetId=spreadsheet_id,
+                        body={'requests': [
+                            status_cell_request(metadata.sheet_id, target, col_idx, value, note_text)
+                            for _, target, value, note_text, _ in writes
+                        ]}
+                    ), kind='write', priority=PRIORITY_WRITE)
+            except HttpError as e:
+                if is_transient_error(e):
+                    # Quota or server hiccup, not stale metadata; the caller decides whether to retry
+                    for row_index, _, _, _ in chunk:
+                        results[row_index] = e
+                    break
+                stale = (metadata.sheet_id, col_idx)
+                metadata = metadata_cache.get(service, spreadsheet_id, tab, header_row, refresh=True)
+                col_idx = find_column(metadata.headers)
+                if attempt == 0 and col_idx is not None and (metadata.sheet_id, col_idx) != stale:
+                    continue
+                # batchUpdate is atomic, so the whole chunk failed
+                for row_index, _, _, _ in chunk:
+                    results[row_index] = e
+                col_idx = stale[1] if col_idx is None else col_idx
+                break
+            except (httplib2.HttpLib2Error, socket.timeout, ConnectionError) as e:
+                # Dropped connection: fail this chunk like a transient HTTP error and keep earlier chunks' results
+                for row_index, _, _, _ in chunk:
+                    results[row_index] = e
+                break
+            snapshot_cache = get_snapshot_cache()
+            mirror = get_mirror()
+            try:
+                # Before any invalidation below: the event's order date comes from the cached snapshot
+                record_status_writes(spreadsheet_id, tab, header_row, writes, find_key_column)
+            except Exception:
+                # Analytics must never fail a write that already landed
+                pass
+            for row_index, target, value, _, _ in writes:
+                results[row_index] = None
+                if target != row_index:
+                    moved[row_index] = target
+                    continue
+                snapshot_cache.patch_cell(spreadsheet_id, tab, row_index, col_idx, value)
+                if mirror is not None:
+                    mirror.patch_cell(spreadsheet_id, tab, row_index, col_idx, value)
+            if len(writes) < len(chunk) or any(target != row_index for row_index, target, _, _, _ in writes):
+                # Cached row positions are out of date: reload rather than patch the wrong rows
+                snapshot_cache.invalidate(spreadsheet_id, tab)
+                if mirror is not None:
+                    mirror.request_sync()
+            break
+    return col_idx, results, moved
+
+
+def is_transient_error(error):
+    """True for errors worth retrying: 429, 5xx and dropped connections"""
+    if isinstance(error, HttpError):
+        return error.resp.status in (429, 500, 502, 503, 504)
+    return isinstance(error, (httplib2.HttpLib2Error, socket.timeout, ConnectionError))
+
+
+def write_status_cell(service, spreadsheet_id, tab, header_row, find_column, row_index, value, note_text,
+                      find_key_column=None, expected_key=None):
+    """Write one status value and its note in a single batchUpdate; returns the column or None
+
+    Without an expected_key, the row's identity cell in the cached snapshot is what gets verified.
+    """
+    if expected_key is None:
+        expected_key = cached_row_key(spreadsheet_id, tab, header_row, find_key_column, row_index)
+    col_idx, results, _ = write_status_cells(
+        service, spreadsheet_id, tab, header_row, find_column, [(row_index, value, note_text, expected_key)],
+        find_key_column
+    )
+    if results.get(row_index) is not None:
+        raise results[row_index]
+    return col_idx
+
+# ============== WRITE QUEUE ==============
+
+class WriteTicket:
+    """State of one queued status write, as shown to the operator"""
+
+    # queued -> committing -> committed | failed; coalesced when a newer write to the same cell replaced it
+    def __init__(self, ticket_id, spreadsheet_id, tab, row_index, value):
+        self.id = ticket_id
+        self.spreadsheet_id = spreadsheet_id
+        self.tab = tab
+        self.row_index = row_index
+        self.value = value
+        self.state = 'queued'
+        self.error = None
+        self.attempts = 0
+        # Row the write was aimed at when the order turned out to have moved
+        self.moved_from = None
+        self.updated_at = time.time()
+
+    def set_state(self, state, error=None):
+        self.state = state
+        self.error = error
+        self.updated_at = time.time()
+
+
+class QueuedWrite:
+    """A pending cell write plus what the writer thread needs to commit it"""
+
+    def __init__(self, ticket, service, header_row, find_column, note_text, find_key_column, expected_key):
+        self.ticket = ticket
+        self.service = service
+        self.header_row = header_row
+        self.find_column = find_column
+        self.note_text = note_text
+        self.find_key_column = find_key_column
+        self.expected_key = expected_key
+        self.due = time.monotonic()
+
+    @property
+    def key(self):
+        return (self.ticket.spreadsheet_id, self.ticket.tab, self.ticket.row_index)
+
+
+class StatusWriteQueue:
+    """Write-behind queue for status cells, flushed by one background thread per server process
+
+    Writes to the same cell coalesce (only the newest is sent), due writes are
+    sent as one batch per tab and submitting session every flush interval, and
+    transient failures are retried with exponential backoff.
+    """
+
+    MAX_TICKETS = 1000
+
+    def __init__(self, flush_interval, max_attempts):
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._in_flight = 0
+        self._tickets = OrderedDict()
+        self._ids = itertools.count(1)
+        self._counts = {'committed': 0, 'failed': 0, 'coalesced': 0, 'retried': 0}
+        self._thread = threading.Thread(target=self._run, name='status-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, service, spreadsheet_id, tab, header_row, find_column, row_index, value, note_text,
+               find_key_column=None, expected_key=None):
+        """Queue a write and return its ticket immediately"""
+        with self._lock:
+            ticket = WriteTicket(next(self._ids), spreadsheet_id, tab, row_index, value)
+            item = QueuedWrite(ticket, service, header_row, find_column, note_text, find_key_column, expected_key)
+            previous = self._pending.get(item.key)
+            if previous is not None:
+                previous.ticket.set_state('coalesced')
+                self._counts['coalesced'] += 1
+            self._pending[item.key] = item
+            self._tickets[ticket.id] = ticket
+            while len(self._tickets) > self.MAX_TICKETS:
+                self._tickets.popitem(last=False)
+        return ticket
+
+    def ticket(self, ticket_id):
+        with self._lock:
+            return self._tickets.get(ticket_id)
+
+    def stats(self):
+        """Queue depth (waiting + being sent) and lifetime outcome counts"""
+        with self._lock:
+            return {'depth': len(self._pending) + self._in_flight, **self._counts}
+
+    def _run(self):
+        CALL_TAG.set('write_queue')
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Never let one bad batch kill the writer thread
+                pass
+
+    def flush(self):
+        """Send every due write, one batch per tab and session"""
+        now = time.monotonic()
+        with self._lock:
+            due = [item for item in self._pending.values() if item.due <= now]
+            for item in due:
+                del self._pending[item.key]
+                item.ticket.set_state('committing')
+            self._in_flight += len(due)
+        
+        # Every write goes out under the credentials of the session that queued it, so
+        # permissions, revision history and per-user quota belong to that operator
+        groups = {}
+        for item in due:
+            groups.setdefault((item.ticket.spreadsheet_id, item.ticket.tab, item.service), []).append(item)
+        for (spreadsheet_id, tab, service), items in groups.items():
+            newest = items[-1]
+            try:
+                col_idx, results, moved = write_status_cells(
+                    service, spreadsheet_id, tab, newest.header_row, newest.find_column,
+                    [(item.ticket.row_index, item.ticket.value, item.note_text, item.expected_key) for item in items],
+                    newest.find_key_column
+                )
+                if col_idx is None:
+                    results = {item.ticket.row_index: ValueError("Status column not found") for item in items}
+            except Exception as e:
+                results, moved = {item.ticket.row_index: e for item in items}, {}
+            for item in items:
+                self._settle(item, results.get(item.ticket.row_index), moved.get(item.ticket.row_index))
+
+    def _settle(self, item, error, moved_to=None):
+        ticket = item.ticket
+        with self._lock:
+            self._in_flight -= 1
+            ticket.attempts += 1
+            if error is None:
+                if moved_to is not None:
+                    # The order had moved in the sheet; the write followed it
+                    ticket.moved_from, ticket.row_index = ticket.row_index, moved_to
+                ticket.set_state('committed')
+                self._counts['committed'] += 1
+                return
+            if is_transient_error(error) and ticket.attempts < self.max_attempts:
+                if item.key in self._pending:
+                    # A newer write to the same cell is already waiting
+                    ticket.set_state('coalesced', error)
+                    self._counts['coalesced'] += 1
+                    return
+                item.due = time.monotonic() + WRITE_RETRY_BASE_SECONDS * 2 ** (ticket.attempts - 1)
+                ticket.set_state('queued', error)
+                self._pending[item.key] = item
+                self._counts['retried'] += 1
+                return
+            ticket.set_state('failed', error)
+            self._counts['failed'] += 1
+        # The optimistic value in the cached snapshot never made it to the sheet
+        get_snapshot_cache().invalidate(ticket.spreadsheet_id, ticket.tab)
+
+
+@st.cache_resource
+def get_write_queue():
+    """Single background status writer for the whole server process"""
+    return StatusWriteQueue(WRITE_FLUSH_INTERVAL, WRITE_MAX_ATTEMPTS)
+
+
+def queue_status_write(service, spreadsheet_id, tab, header_row, find_column, row_index, value, note_text,
+                       find_key_column=None, expected_key=None):
+    """Hand a status write to the background writer; returns its ticket, or None if the tab has no status column
+
+    The cached snapshot shows the new value straight away and is reloaded if
+    the write finally fails or the row turns out to have moved. Without an
+    expected_key, the row's identity cell in the cached snapshot is verified.
+    """
+    metadata = get_metadata_cache().get(service, spreadsheet_id, tab, header_row)
+    col_idx = find_column(metadata.headers)
+    if col_idx is None:
+        return None
+    if expected_key is None:
+        expected_key = cached_row_key(spreadsheet_id, tab, header_row, find_key_column, row_index)
+    get_snapshot_cache().patch_cell(spreadsheet_id, tab, row_index, col_idx, value)
+    return get_write_queue().submit(service, spreadsheet_id, tab, header_row, find_column, row_index, value,
+                                    note_text, find_key_column, expected_key)
+
+# ============== PAGED READS ==============
+
+def column_letter(col_idx):
+    """A1 column letters for a 0-based column index (0 -> A, 26 -> AA, 702 -> AAA)"""
+    letters = ''
+    col_idx += 1
+    while col_idx:
+        col_idx, rem = divmod(col_idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def prefetch_map(fn, items, workers):
+    """Map fn over items on a thread pool, yielding results in order with at most `workers` in flight"""
+    items = iter(items)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        # Each page runs in a copy of the caller's context so its Sheets calls keep the caller's tag
+        in_flight = deque(pool.submit(contextvars.copy_context().run, fn, item)
+                          for _, item in zip(range(workers), items))
+        while in_flight:
+            result = in_flight.popleft().result()
+            for item in items:
+                in_flight.append(pool.submit(contextvars.copy_context().run, fn, item))
+                break
+            yield result
+    finally:
+        # Consumer stopped early (or a page failed): don't fetch pages nobody will read
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_sheet_chunks(service, spreadsheet_id, tab, header_row, chunk_rows=None, workers=None,
+                      priority=PRIORITY_READ):
+    """Yield (start_row, rows) pages of a tab from header_row to the end of its grid
+
+    Every page is padded with [] to its full height, so rows[n] is sheet row start_row + n.
+    """
+    chunk_rows = chunk_rows or SHEET_CHUNK_ROWS
+    workers = workers or SHEET_READ_WORKERS
+    # Every full read refreshes the tab's metadata, so the grid size (and headers) are current
+    metadata = get_metadata_cache().get(service, spreadsheet_id, tab, header_row, refresh=True, priority=priority)
+    row_count = metadata.row_count
+    last_col = column_letter(metadata.col_count - 1)
+
+    def fetch(start):
+        end = min(start + chunk_rows - 1, row_count)
+        request = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"'{tab}'!A{start}:{last_col}{end}"
+        )
+        rows = sheets_call(request, priority=priority).get('values', [])
+        # The API drops trailing blank rows of each page; pad so later pages keep their row numbers
+        return rows + [[] for _ in range(end - start + 1 - len(rows))]
+
+    starts = range(header_row, row_count + 1, chunk_rows)
+    if workers > 1 and len(starts) > 1:
+        chunks = prefetch_map(fetch, starts, workers)
+    else:
+        chunks = map(fetch, starts)
+    yield from zip(starts, chunks)
+
+
+def iter_sheet_rows(service, spreadsheet_id, tab, header_row, chunk_rows=None, workers=None,
+                    priority=PRIORITY_READ):
+    """Yield every row of a tab from header_row down, fetched in row chunks
+
+    Rows come out in sheet order (row header_row + n is the n-th item) with
+    trailing blank rows dropped, so callers can stop early without paying for
+    the rest of the sheet.
+    """
+    blank_run = 0
+    for _, chunk in iter_sheet_chunks(service, spreadsheet_id, tab, header_row, chunk_rows, workers, priority):
+        for row in chunk:
+            if not row:
+                blank_run += 1
+                continue
+            for _ in range(blank_run):
+                yield []
+            blank_run = 0
+            yield row
+
+# ============== STATUS EVENTS ==============
+
+# The notes mark_handover / mark_bundling_status attach, which are also the only record of older writes
+HANDOVER_NOTE = re.compile(r"Handed over by (?P<user>.+) on (?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+STATUS_NOTE = re.compile(r"Marked '(?P<status>[^']*)' by (?P<user>.+) on (?P<ts>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})")
+
+
+def parse_status_note(note):
+    """(user, status, datetime) from a status note, or None if it isn't one; a handover is always 'Done'"""
+    note = (note or '').strip()
+    match = HANDOVER_NOTE.fullmatch(note) or STATUS_NOTE.fullmatch(note)
+    if match is None:
+        return None
+    # Read the status from the note, never the cell, which may have been edited since
+    status = match.groupdict().get('status', 'Done')
+    return match.group('user'), status, datetime.strptime(match.group('ts'), "%Y-%m-%d %H:%M:%S")
+
+
+def status_event(stage, note, order, row_index, order_date, source):
+    """Event dict for one status write, built from its note so live events and backfilled ones agree"""
+    parsed = parse_status_note(note)
+    if parsed is None:
+        return None
+    user, status, written_at = parsed
+    ordinal = parse_sheet_date(order_date) if order_date else None
+    return {
+        'ts': written_at.timestamp(),
+        'stage': stage,
+        'user': user,
+        'status': status,
+        'order': order or None,
+        'row': row_index,
+        # Whole days from the order's date to this write, for time-to-handover
+        'days': None if ordinal is None else written_at.toordinal() - ordinal,
+        'source': source,
+    }
+
+
+class ThroughputStats:
+    """Running totals over status events; every update and every dashboard read is independent of history size"""
+
+    def __init__(self):
+        self.by_status = {}     # (stage, status) -> count
+        self.by_user = {}       # user -> {(stage, status): count}
+        self.by_hour = {}       # (hour start, stage) -> count
+        self.by_user_hour = {}  # (user, hour start) -> count
+        self.handover_days = {}  # whole days from order date to handover -> count
+        self.events = 0
+        self.first_ts = self.last_ts = None
+
+    def add(self, event):
+        stage, status, user = event['stage'], event['status'], event['user']
+        hour = int(event['ts'] // 3600 * 3600)
+        self.by_status[(stage, status)] = self.by_status.get((stage, status), 0) + 1
+        counts = self.by_user.setdefault(user, {})
+        counts[(stage, status)] = counts.get((stage, status), 0) + 1
+        self.by_hour[(hour, stage)] = self.by_hour.get((hour, stage), 0) + 1
+        self.by_user_hour[(user, hour)] = self.by_user_hour.get((user, hour), 0) + 1
+        if stage == 'Handover' and event.get('days') is not None and event['days'] >= 0:
+            self.handover_days[event['days']] = self.handover_days.get(event['days'], 0) + 1
+        self.events += 1
+        self.first_ts = event['ts'] if self.first_ts is None else min(self.first_ts, event['ts'])
+        self.last_ts = event['ts'] if self.last_ts is None else max(self.last_ts, event['ts'])
+
+    def hourly(self, hours, now):
+        """Events per stage for each of the last `hours` hours, oldest first"""
+        current = int(now // 3600 * 3600)
+        starts = [current - 3600 * back for back in range(hours - 1, -1, -1)]
+        return starts, {stage: [self.by_hour.get((start, stage), 0) for start in starts] for stage in SEARCH_STAGES}
+
+    def operators(self, hours, now):
+        """Per-operator totals by stage and status, plus their rate over the last `hours` hours"""
+        current = int(now // 3600 * 3600)
+        rows = []
+        for user, counts in self.by_user.items():
+            recent = sum(self.by_user_hour.get((user, current - 3600 * back), 0) for back in range(hours))
+            rows.append({
+                'Operator': user,
+                **{f"{stage} {status}": count for (stage, status), count in sorted(counts.items())},
+                'Last hour': self.by_user_hour.get((user, current), 0),
+                f"Per hour ({hours}h)": round(recent / hours, 2),
+            })
+        return sorted(rows, key=lambda row: -row[f"Per hour ({hours}h)"])
+
+    def handover_day_quantile(self, q):
+        """Days from order date to handover below which a fraction q of handovers fall"""
+        total = sum(self.handover_days.values())
+        if not total:
+            return None
+        seen = 0
+        for days in sorted(self.handover_days):
+            seen += self.handover_days[days]
+            if seen >= q * total:
+                return days
+        return None
+
+
+class EventLog:
+    """Append-only JSON-lines log of status writes, with ThroughputStats kept in step
+
+    Every successful status write is recorded here; the log is replayed on start,
+    so the dashboard survives restarts without reading anything from Sheets. Events
+    are deduplicated on (stage, order/row, status, time, user), which lets the note
+    backfill run again, or overlap live writes, without double counting.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen = set()
+        self.stats = ThroughputStats()
+        self.backfill_state = {}
+        self._backfill_thread = None
+        if path and os.path.exists(path):
+            with open(path) as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; everything before and after it still counts
+                        continue
+                    if entry.get('type') == 'backfill':
+                        self.backfill_state[entry['stage']] = {'done': True, 'rows': entry.get('rows'), 'found': entry.get('found')}
+                    else:
+                        self._add(entry)
+
+    @staticmethod
+    def _event_id(event):
+        return (event['stage'], event['order'] or event['row'], event['status'], event['ts'], event['user'])
+
+    def _add(self, event):
+        event_id = self._event_id(event)
+        if event_id in self._seen:
+            return False
+        self._seen.add(event_id)
+        self.stats.add(event)
+        return True
+
+    def record(self, events):
+        """Add events (skipping ones already recorded) and append them to the log; returns how many were new"""
+        with self._lock:
+            fresh = [event for event in events if event is not None and self._add(event)]
+            self._append(fresh)
+        return len(fresh)
+
+    def summary(self, hours, now=None):
+        """Everything the Throughput tab shows, read under the lock so writers can't change it mid-read"""
+        now = time.time() if now is None else now
+        with self._lock:
+            stats = self.stats
+            starts, hourly = stats.hourly(hours, now)
+            return {
+                'events': stats.events,
+                'by_status': dict(stats.by_status),
+                'hour_starts': starts,
+                'hourly': hourly,
+                'operators': stats.operators(hours, now),
+                'handover_p50': stats.handover_day_quantile(0.5),
+                'handover_p90': stats.handover_day_quantile(0.9),
+                'backfill': {stage: dict(state) for stage, state in self.backfill_state.items()},
+            }
+
+    def _append(self, entries):
+        if self.path and entries:
+            with open(self.path, 'a') as log:
+                log.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+    def backfill(self, service, stages=None):
+        """Start the one-off note backfill on a background thread; False if one is already running"""
+        with self._lock:
+            if self._backfill_thread is not None and self._backfill_thread.is_alive():
+                return False
+            stages = list(stages or SEARCH_STAGES)
+            for stage in stages:
+                self.backfill_state[stage] = {'done': False, 'rows': 0, 'found': 0}
+            self._backfill_thread = threading.Thread(target=self._run_backfill, args=(service, stages),
+                                                     name='note-backfill', daemon=True)
+            self._backfill_thread.start()
+        return True
+
+    def _run_backfill(self, service, stages):
+        CALL_TAG.set('note_backfill')
+        for stage in stages:
+            state = self.backfill_state[stage]
+            try:
+                for rows, events in iter_note_events(service, stage):
+                    state['found'] += self.record(events)
+                    state['rows'] += rows
+            except Exception as e:
+                state['error'] = str(e)
+                continue
+            state['done'] = True
+            with self._lock:
+                self._append([{'type': 'backfill', 'stage': stage, 'rows': state['rows'], 'found': state['found'],
+                               'ts': time.time()}])
+
+
+@st.cache_resource(show_spinner=False)
+def get_event_log():
+    """Single status event log for the whole server process"""
+    return EventLog(EVENT_LOG_PATH or None)
+
+
+def stage_for(spreadsheet_id):
+    """SEARCH_STAGES name of a spreadsheet, or None"""
+    for stage, (stage_sheet_id, _, _) in SEARCH_STAGES.items():
+        if stage_sheet_id == spreadsheet_id:
+            return stage
+    return None
+
+
+def record_status_writes(spreadsheet_id, tab, header_row, writes, find_key_column):
+    """Log an event for each (row_index, target, value, note_text, expected_key) that was just written
+
+    The order's date comes from the cached snapshot: from the row written when it
+    still holds the order, else through the key index, so a row that moved still
+    finds its date.
+    """
+    stage = stage_for(spreadsheet_id)
+    if stage is None:
+        return
+    entry = get_snapshot_cache().peek(spreadsheet_id, tab_range(tab, header_row))
+    date_col = key_col = None
+    if entry is not None and entry.values:
+        date_col = find_date_column(entry.values[0])
+        key_col = find_key_column(entry.values[0]) if find_key_column else None
+    events = []
+    for row_index, target, _, note_text, expected in writes:
+        order_date = None
+        if date_col is not None:
+            pos = row_index - entry.first_row
+            keyed = bool(expected) and key_col is not None
+            if not 0 < pos < len(entry.values) or (
+                    keyed and normalize_key(entry.values.cell(pos, key_col)) != normalize_key(expected)):
+                found = entry.key_index([key_col]).lookup(expected) if keyed else []
+                pos = found[0] + 1 if found else None
+            if pos is not None:
+                order_date = entry.values.cell(pos, date_col)
+        events.append(status_event(stage, note_text, expected, target, order_date, 'write'))
+    get_event_log().record(events)
+
+
+def iter_note_events(service, stage, chunk_rows=None):
+    """Yield (rows scanned, events) per chunk of a stage's tab, parsed from its status notes
+
+    Each chunk is one spreadsheets.get of just the status, key and date columns,
+    asking only for values and notes, at background priority.
+    """
+    spreadsheet_id, tab, header_row = SEARCH_STAGES[stage]
+    find_key_column, find_column = STAGE_COLUMNS[stage]
+    chunk_rows = chunk_rows or SHEET_CHUNK_ROWS
+    metadata = get_metadata_cache().get(service, spreadsheet_id, tab, header_row, refresh=True,
+                                        priority=PRIORITY_BACKGROUND)
+    headers = metadata.headers
+    status_col, key_col, date_col = find_column(headers), find_key_column(headers), find_date_column(headers)
+    if status_col is None:
+        return
+    columns = [col for col in (status_col, key_col, date_col) if col is not None]
+    for start in range(header_row + 1, metadata.row_count + 1, chunk_rows):
+        end = min(start + chunk_rows - 1, metadata.row_count)
+        result = sheets_call(service.spreadsheets().get(
+            spreadsheetId=spreadsheet_id,
+            ranges=[f"'{tab}'!{column_letter(col)}{start}:{column_letter(col)}{end}" for col in columns],
+            includeGridData=True,
+            fields='sheets(data(rowData(values(formattedValue,note))))'
+        ), priority=PRIORITY_BACKGROUND)
+        data = result['sheets'][0].get('data', [])
+        cells = {}
+        for col, grid in zip(columns, data):
+            for offset, row in enumerate(grid.get('rowData') or []):
+                value = (row.get('values') or [{}])[0]
+                cells[(offset, col)] = value
+        events = []
+        for offset in range(end - start + 1):
+            status_cell = cells.get((offset, status_col), {})
+            if not status_cell.get('note'):
+                continue
+            key = cells.get((offset, key_col), {}).get('formattedValue') if key_col is not None else None
+            order_date = cells.get((offset, date_col), {}).get('formattedValue') if date_col is not None else None
+            events.append(status_event(stage, status_cell['note'], key, start + offset, order_date, 'backfill'))
+        yield end - start + 1, events
+
+# ============== LOCAL MIRROR ==============
+
+class SheetMirror:
+    """SQLite mirror of sheet tabs, kept current by a background sync thread
+
+    Each sync pages through the tab, hashes every page and only re-diffs pages
+    whose hash changed, so unchanged rows are never rewritten. Substring search
+    uses an FTS5 trigram index when SQLite has one. Writes land in Sheets first
+    and are then patched in with patch_cell.
+    """
 
-def search_handover(service, search_term):
-    """Search in Handover sheet"""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=HANDOVER_SHEET_ID,
-            range=f"'{HANDOVER_TAB}'!A3:Z1000"
-        ).execute()
-        
-        values = result.get('values', [])
-        if not values:
-            return None, None, []
-        
-        headers = values[0]
-        data_rows = values[1:]
+    # Cells are joined with a unit separator so a term can't match across two cells
+    CELL_SEP = '\x1f'
+
+    # Bumped whenever stored columns change; an older mirror file is dropped and resynced
+    SCHEMA_VERSION = 3
+
+    # ORDER BY for each of PENDING_SORTS, matching pending_sort_key (undated rows last);
+    # each is the tail of an index below, so a page is read in order instead of sorted
+    PENDING_ORDER = {
+        'Sheet order': "row_index",
+        'Oldest first': "date_ordinal IS NULL, date_ordinal, row_index",
+        'Newest first': "date_ordinal IS NULL, -date_ordinal, row_index",
+        'Vendor': "vendor, row_index",
+    }
+
+    def __init__(self, path, tabs, interval):
+        self.path = path
+        # tabs: [(spreadsheet_id, tab, header_row, find_status_column)]
+        self.tabs = tabs
+        self.interval = interval
+        self._local = threading.local()
+        # The logged-in session whose service the sync uses, as (credentials key, service)
+        self._service = None
+        self._service_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stats = {}
+        self.fts = self._create_schema()
+        self._thread = threading.Thread(target=self._run, name='sheet-mirror', daemon=True)
+        self._thread.start()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _create_schema(self):
+        conn = self._conn()
+        with conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < self.SCHEMA_VERSION:
+                # The mirror is only a copy of the sheets: rebuild it rather than migrate it
+                conn.executescript("""
+                    DROP TABLE IF EXISTS mirror_tabs;
+                    DROP TABLE IF EXISTS mirror_chunks;
+                    DROP TABLE IF EXISTS mirror_rows;
+                    DROP TABLE IF EXISTS mirror_fts;
+                """)
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS mirror_tabs (
+                    spreadsheet_id TEXT NOT NULL,
+                    tab TEXT NOT NULL,
+                    header_row INTEGER NOT NULL,
+                    headers TEXT NOT NULL,
+                    status_col INTEGER,
+                    vendor_col INTEGER,
+                    date_col INTEGER,
+                    synced_at REAL,
+                    PRIMARY KEY (spreadsheet_id, tab)
+                );
+                CREATE TABLE IF NOT EXISTS mirror_chunks (
+                    spreadsheet_id TEXT NOT NULL,
+                    tab TEXT NOT NULL,
+                    start_row INTEGER NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (spreadsheet_id, tab, start_row)
+                );
+                CREATE TABLE IF NOT EXISTS mirror_rows (
+                    id INTEGER PRIMARY KEY,
+                    spreadsheet_id TEXT NOT NULL,
+                    tab TEXT NOT NULL,
+                    row_index INTEGER NOT NULL,
+                    cells TEXT NOT NULL,
+                    search_text TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    vendor TEXT NOT NULL,
+                    date_ordinal INTEGER,
+                    UNIQUE (spreadsheet_id, tab, row_index)
+                );
+                CREATE INDEX IF NOT EXISTS mirror_rows_status ON mirror_rows (spreadsheet_id, tab, status, row_index);
+                CREATE INDEX IF NOT EXISTS mirror_rows_oldest
+                    ON mirror_rows (spreadsheet_id, tab, date_ordinal IS NULL, date_ordinal, row_index);
+                CREATE INDEX IF NOT EXISTS mirror_rows_newest
+                    ON mirror_rows (spreadsheet_id, tab, date_ordinal IS NULL, -date_ordinal, row_index);
+                CREATE INDEX IF NOT EXISTS mirror_rows_vendor ON mirror_rows (spreadsheet_id, tab, vendor, row_index);
+            """)
+            try:
+                conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS mirror_fts USING fts5(search_text, tokenize='trigram')")
+                return True
+            except sqlite3.OperationalError:
+                # SQLite older than 3.34: fall back to scanning search_text
+                return False
+
+    def register_service(self, service, owner):
+        """Remember a logged-in session's service for the background sync to use; owner is its credentials_key"""
+        with self._service_lock:
+            first = self._service is None
+            self._service = (owner, service)
+        if first:
+            # Don't make the first operator wait a whole interval for the initial sync
+            self._wake.set()
+
+    def forget_service(self, owner):
+        """Stop syncing with a user's credentials once they log out; the next session to run registers its own"""
+        with self._service_lock:
+            if self._service is not None and self._service[0] == owner:
+                self._service = None
+
+    def request_sync(self):
+        """Start the next sync now instead of at the end of the interval"""
+        self._wake.set()
+
+    def _run(self):
+        CALL_TAG.set('mirror_sync')
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            registered = self._service
+            if registered is not None:
+                self.sync_all(registered[1])
+
+    def sync_all(self, service):
+        for spreadsheet_id, tab, header_row, find_status_column in self.tabs:
+            stats = self._stats.setdefault((spreadsheet_id, tab), {})
+            try:
+                stats.update(self.sync_tab(service, spreadsheet_id, tab, header_row, find_status_column))
+                stats['error'] = None
+            except Exception as e:
+                stats['error'] = str(e)
+
+    def _row_values(self, row, columns):
+        """Stored fields of a row; columns is (status_col, vendor_col, date_col) of its tab"""
+        status_col, vendor_col, date_col = columns
+        text = self.CELL_SEP.join(str(cell).lower() for cell in row)
+        # Normalized the way PendingIndex filters and sorts, so SQL can order and page the pending list
+        status = PendingIndex._cell(row, status_col).strip().lower()
+        vendor = PendingIndex._cell(row, vendor_col).strip().lower()
+        ordinal = parse_sheet_date(PendingIndex._cell(row, date_col)) if date_col is not None else None
+        return json.dumps(row), text, status, vendor, ordinal
+
+    def _put_row(self, conn, spreadsheet_id, tab, row_index, row, columns):
+        cells, text, status, vendor, ordinal = self._row_values(row, columns)
+        found = conn.execute(
+            "SELECT id FROM mirror_rows WHERE spreadsheet_id = ? AND tab = ? AND row_index = ?",
+            (spreadsheet_id, tab, row_index)
+        ).fetchone()
+        if found is None:
+            row_id = conn.execute(
+                "INSERT INTO mirror_rows (spreadsheet_id, tab, row_index, cells, search_text, status, vendor, date_ordinal) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (spreadsheet_id, tab, row_index, cells, text, status, vendor, ordinal)
+            ).lastrowid
+        else:
+            row_id = found[0]
+            conn.execute("UPDATE mirror_rows SET cells = ?, search_text = ?, status = ?, vendor = ?, date_ordinal = ? "
+                         "WHERE id = ?", (cells, text, status, vendor, ordinal, row_id))
+            if self.fts:
+                conn.execute("DELETE FROM mirror_fts WHERE rowid = ?", (row_id,))
+        if self.fts:
+            conn.execute("INSERT INTO mirror_fts (rowid, search_text) VALUES (?, ?)", (row_id, text))
+
+    def _delete_rows(self, conn, spreadsheet_id, tab, where, params):
+        condition = f"spreadsheet_id = ? AND tab = ? AND {where}"
+        params = (spreadsheet_id, tab, *params)
+        if self.fts:
+            conn.execute(f"DELETE FROM mirror_fts WHERE rowid IN (SELECT id FROM mirror_rows WHERE {condition})", params)
+        return conn.execute(f"DELETE FROM mirror_rows WHERE {condition}", params).rowcount
+
+    def sync_tab(self, service, spreadsheet_id, tab, header_row, find_status_column):
+        """Bring one tab up to date; returns counts of what changed"""
+        conn = self._conn()
+        started = time.monotonic()
+        counts = {'chunks': 0, 'chunks_changed': 0, 'rows_written': 0, 'rows_deleted': 0}
+        stored_hashes = dict(conn.execute(
+            "SELECT start_row, hash FROM mirror_chunks WHERE spreadsheet_id = ? AND tab = ?",
+            (spreadsheet_id, tab)
+        ))
+        seen_starts = []
+        last_row = header_row
+        for start, rows in iter_sheet_chunks(service, spreadsheet_id, tab, header_row, priority=PRIORITY_BACKGROUND):
+            counts['chunks'] += 1
+            seen_starts.append(start)
+            last_row = start + len(rows) - 1
+            if start == header_row:
+                headers = rows[0] if rows else []
+                columns = (find_status_column(headers), find_vendor_column(headers), find_date_column(headers))
+                stored = conn.execute(
+                    "SELECT headers FROM mirror_tabs WHERE spreadsheet_id = ? AND tab = ?", (spreadsheet_id, tab)
+                ).fetchone()
+                if stored is None or json.loads(stored[0]) != headers:
+                    # New tab or columns moved: every stored row is suspect
+                    with conn:
+                        self._delete_rows(conn, spreadsheet_id, tab, "1", ())
+                        conn.execute("DELETE FROM mirror_chunks WHERE spreadsheet_id = ? AND tab = ?", (spreadsheet_id, tab))
+                        conn.execute(
+                            "INSERT OR REPLACE INTO mirror_tabs "
+                            "(spreadsheet_id, tab, header_row, headers, status_col, vendor_col, date_col, synced_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, NULL)",
+                            (spreadsheet_id, tab, header_row, json.dumps(headers), *columns)
+                        )
+                    stored_hashes = {}
+            
+            chunk_hash = hashlib.sha1(json.dumps(rows).encode()).hexdigest()
+            if stored_hashes.get(start) == chunk_hash:
+                continue
+            counts['chunks_changed'] += 1
+            end = start + len(rows) - 1
+            existing = dict(conn.execute(
+                "SELECT row_index, cells FROM mirror_rows WHERE spreadsheet_id = ? AND tab = ? AND row_index BETWEEN ? AND ?",
+                (spreadsheet_id, tab, start, end)
+            ))
+            with conn:
+                for offset, row in enumerate(rows):
+                    row_index = start + offset
+                    if row_index == header_row:
+                        continue
+                    if not row:
+                        # Blank rows aren't mirrored
+                        if row_index in existing:
+                            counts['rows_deleted'] += self._delete_rows(conn, spreadsheet_id, tab, "row_index = ?", (row_index,))
+                        continue
+                    if existing.get(row_index) != json.dumps(row):
+                        self._put_row(conn, spreadsheet_id, tab, row_index, row, columns)
+                        counts['rows_written'] += 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO mirror_chunks (spreadsheet_id, tab, start_row, hash) VALUES (?, ?, ?, ?)",
+                    (spreadsheet_id, tab, start, chunk_hash)
+                )
         
-        # Find matching rows
+        with conn:
+            # The grid shrank: drop rows and pages past its end
+            counts['rows_deleted'] += self._delete_rows(conn, spreadsheet_id, tab, "row_index > ?", (last_row,))
+            conn.execute(
+                f"DELETE FROM mirror_chunks WHERE spreadsheet_id = ? AND tab = ? AND start_row NOT IN ({','.join('?' * len(seen_starts))})",
+                (spreadsheet_id, tab, *seen_starts)
+            )
+            conn.execute("UPDATE mirror_tabs SET synced_at = ? WHERE spreadsheet_id = ? AND tab = ?",
+                         (time.time(), spreadsheet_id, tab))
+        counts['seconds'] = time.monotonic() - started
+        return counts
+
+    def _tab_info(self, spreadsheet_id, tab):
+        found = self._conn().execute(
+            "SELECT header_row, headers, status_col, vendor_col, date_col, synced_at FROM mirror_tabs "
+            "WHERE spreadsheet_id = ? AND tab = ?",
+            (spreadsheet_id, tab)
+        ).fetchone()
+        if found is None:
+            return None
+        return {'header_row': found[0], 'headers': json.loads(found[1]), 'status_col': found[2],
+                'columns': found[2:5], 'synced_at': found[5]}
+
+    def is_ready(self, spreadsheet_id, tab):
+        """True once the tab has completed at least one sync"""
+        info = self._tab_info(spreadsheet_id, tab)
+        return info is not None and info['synced_at'] is not None
+
+    def _matches(self, headers, found):
         matches = []
-        for idx, row in enumerate(data_rows):
+        for row_index, cells in found:
+            row = json.loads(cells)
             row_extended = row + [''] * (len(headers) - len(row))
-            for cell in row_extended:
-                if search_term.lower() in str(cell).lower():
-                    matches.append({
-                        'row_index': idx + 4,  # +4 because headers at row 3, data starts row 4
-                        'data': dict(zip(headers, row_extended))
-                    })
-                    break
-        
-        return headers, data_rows, matches
-    except HttpError as e:
-        if e.resp.status == 403:
-            st.error("❌ Aapko is sheet ka access nahi hai. Sheet owner se permission lein.")
+            matches.append({'row_index': row_index, 'data': dict(zip(headers, row_extended))})
+        return matches
+
+    def _substring_rows(self, spreadsheet_id, tab, term):
+        """(row_index, cells json) of rows with a cell containing term, in sheet order"""
+        conn = self._conn()
+        if self.fts and len(term) >= 3:
+            phrase = '"' + term.replace('"', '""') + '"'
+            found = conn.execute(
+                "SELECT r.row_index, r.cells, r.search_text FROM mirror_fts f JOIN mirror_rows r ON r.id = f.rowid "
+                "WHERE mirror_fts MATCH ? AND r.spreadsheet_id = ? AND r.tab = ? ORDER BY r.row_index",
+                (phrase, spreadsheet_id, tab)
+            ).fetchall()
         else:
-            st.error(f"Error: {str(e)}")
+            found = conn.execute(
+                "SELECT row_index, cells, search_text FROM mirror_rows "
+                "WHERE spreadsheet_id = ? AND tab = ? AND instr(search_text, ?) > 0 ORDER BY row_index",
+                (spreadsheet_id, tab, term)
+            ).fetchall()
+        # The trigram index folds case its own way; keep Python's lower() semantics exact
+        return [(row_index, cells) for row_index, cells, text in found if term in text]
+
+    def search(self, spreadsheet_id, tab, search_term):
+        """Rows matching a search box entry (substring or field query): (headers, matches)"""
+        info = self._tab_info(spreadsheet_id, tab)
+        clauses, free_text = parse_field_query(search_term)
+        if not clauses:
+            found = self._substring_rows(spreadsheet_id, tab, search_term.lower())
+            return info['headers'], self._matches(info['headers'], found)
+        # Every clause value occurs as a substring of its row, so the longest one (or the
+        # free text) narrows the candidates through the trigram index; then check each
+        resolved = resolve_query_fields(clauses, info['headers'])
+        narrowest = max([free_text.lower()] + [value for _, value, _ in resolved], key=len)
+        found = [(row_index, cells) for row_index, cells in self._substring_rows(spreadsheet_id, tab, narrowest)
+                 if row_matches_query(json.loads(cells), resolved, free_text)]
+        return info['headers'], self._matches(info['headers'], found)
+
+    def pending(self, spreadsheet_id, tab, done_statuses, search_term='', sort='Sheet order', offset=0, limit=None):
+        """(headers, total, [(row_index, row)]): one page of rows whose status is not one of done_statuses
+
+        Counting, sorting and paging all happen in SQL, so only the page's rows are decoded.
+        """
+        info = self._tab_info(spreadsheet_id, tab)
+        if info['status_col'] is None:
+            return info['headers'], 0, []
+        conn = self._conn()
+        where = f"spreadsheet_id = ? AND tab = ? AND status NOT IN ({','.join('?' * len(done_statuses))})"
+        params = (spreadsheet_id, tab, *done_statuses)
+        term = search_term.lower()
+        if term:
+            where += " AND instr(search_text, ?) > 0"
+            params += (term,)
+            if self.fts and len(term) >= 3:
+                # Let the trigram index narrow the rows instr has to check
+                where += " AND id IN (SELECT rowid FROM mirror_fts WHERE mirror_fts MATCH ?)"
+                params += ('"' + term.replace('"', '""') + '"',)
+        total = conn.execute(f"SELECT COUNT(*) FROM mirror_rows WHERE {where}", params).fetchone()[0]
+        found = conn.execute(
+            f"SELECT row_index, cells FROM mirror_rows WHERE {where} "
+            f"ORDER BY {self.PENDING_ORDER[sort]} LIMIT ? OFFSET ?",
+            (*params, -1 if limit is None else limit, offset)
+        ).fetchall()
+        return info['headers'], total, [(row_index, json.loads(cells)) for row_index, cells in found]
+
+    def pending_count(self, spreadsheet_id, tab, done_statuses):
+        """Number of rows whose status is not one of done_statuses"""
+        info = self._tab_info(spreadsheet_id, tab)
+        if info is None or info['status_col'] is None:
+            return None
+        return self._conn().execute(
+            f"SELECT COUNT(*) FROM mirror_rows WHERE spreadsheet_id = ? AND tab = ? "
+            f"AND status NOT IN ({','.join('?' * len(done_statuses))})",
+            (spreadsheet_id, tab, *done_statuses)
+        ).fetchone()[0]
+
+    def patch_cell(self, spreadsheet_id, tab, row_index, col_idx, value):
+        """Apply a write that already succeeded in Sheets"""
+        info = self._tab_info(spreadsheet_id, tab)
+        if info is None:
+            return
+        conn = self._conn()
+        found = conn.execute(
+            "SELECT cells FROM mirror_rows WHERE spreadsheet_id = ? AND tab = ? AND row_index = ?",
+            (spreadsheet_id, tab, row_index)
+        ).fetchone()
+        row = json.loads(found[0]) if found else []
+        if col_idx >= len(row):
+            row.extend([''] * (col_idx + 1 - len(row)))
+        row[col_idx] = value
+        with conn:
+            self._put_row(conn, spreadsheet_id, tab, row_index, row, info['columns'])
+            # Forget the page's hash, or an edit back to the old value would match it and never sync
+            conn.execute(
+                "DELETE FROM mirror_chunks WHERE spreadsheet_id = ? AND tab = ? AND start_row = "
+                "(SELECT MAX(start_row) FROM mirror_chunks WHERE spreadsheet_id = ? AND tab = ? AND start_row <= ?)",
+                (spreadsheet_id, tab, spreadsheet_id, tab, row_index)
+            )
+
+    def stats(self):
+        result = []
+        for spreadsheet_id, tab, _, _ in self.tabs:
+            info = self._tab_info(spreadsheet_id, tab) or {}
+            rows = self._conn().execute(
+                "SELECT COUNT(*) FROM mirror_rows WHERE spreadsheet_id = ? AND tab = ?", (spreadsheet_id, tab)
+            ).fetchone()[0]
+            synced_at = info.get('synced_at')
+            result.append({
+                'tab': tab,
+                'rows': rows,
+                'age': None if synced_at is None else time.time() - synced_at,
+                **self._stats.get((spreadsheet_id, tab), {}),
+            })
+        return result
+
+
+@st.cache_resource(show_spinner=False)
+def get_mirror():
+    """The process-wide SQLite mirror, or None when SQLITE_MIRROR_PATH is unset"""
+    if not SQLITE_MIRROR_PATH:
+        return None
+    return SheetMirror(SQLITE_MIRROR_PATH, [
+        (HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW, find_handover_column),
+        (BUNDLING_SHEET_ID, BUNDLING_TAB, BUNDLING_HEADER_ROW, find_packing_column),
+    ], MIRROR_SYNC_INTERVAL)
+
+
+def mirror_for(spreadsheet_id, tab):
+    """The mirror if it is enabled and has synced this tab, else None"""
+    mirror = get_mirror()
+    if mirror is not None and mirror.is_ready(spreadsheet_id, tab):
+        return mirror
+    return None
+
+def search_tab(service, spreadsheet_id, tab, header_row, search_term):
+    """(headers, matches) for a query against one tab, from the mirror if it is ready; raises on failure"""
+    mirror = mirror_for(spreadsheet_id, tab)
+    if mirror is not None:
+        return mirror.search(spreadsheet_id, tab, search_term)
+    
+    snapshot = read_tab(service, spreadsheet_id, tab, header_row)
+    values = snapshot.values
+    if not values:
+        return None, []
+    
+    # Matches are row views into the shared snapshot, nothing is copied per session
+    return values[0], snapshot.matches(snapshot.query(search_term))
+
+def report_search_error(e):
+    """Show why a search failed: a malformed query, missing access or a Sheets error"""
+    if isinstance(e, ValueError):
+        # Malformed field query, e.g. an unknown field name
+        st.error(f"❌ {str(e)}")
+    elif isinstance(e, HttpError) and e.resp.status == 403:
+        st.error("❌ Aapko is sheet ka access nahi hai. Sheet owner se permission lein.")
+    else:
+        st.error(f"Error: {str(e)}")
+
+@tagged
+def search_handover(service, search_term):
+    """Search in Handover sheet: (headers, None, matches); data rows are no longer copied out"""
+    try:
+        headers, matches = search_tab(service, *SEARCH_STAGES['Handover'], search_term)
+        return headers, None, matches
+    except (ValueError, HttpError) as e:
+        report_search_error(e)
         return None, None, []
 
+@tagged
 def search_bundling(service, search_term):
-    """Search in Bundling sheet"""
+    """Search in Bundling sheet: (headers, None, matches); data rows are no longer copied out"""
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=BUNDLING_SHEET_ID,
-            range=f"'{BUNDLING_TAB}'!A1:Z1000"
-        ).execute()
-        
-        values = result.get('values', [])
+        headers, matches = search_tab(service, *SEARCH_STAGES['Bundling'], search_term)
+        return headers, None, matches
+    except (ValueError, HttpError) as e:
+        report_search_error(e)
+        return None, None, []
+
+@tagged
+def search_stage(service, stage, search_term):
+    """search_tab for one of SEARCH_STAGES, tagged for the metrics when run on its own thread"""
+    return search_tab(service, *SEARCH_STAGES[stage], search_term)
+
+def search_everywhere(service, search_term, stages=None):
+    """Search every stage's sheet at once, yielding (stage, headers, matches, error) as each answers
+
+    Cold reads of both sheets overlap, so the wait is the slower sheet's rather than the sum,
+    and a caller can show the first sheet's results while the other is still loading. A failing
+    sheet yields its exception instead of hiding the other's results.
+    """
+    stages = list(stages or SEARCH_STAGES)
+    pool = ThreadPoolExecutor(max_workers=len(stages))
+    try:
+        # Each search runs in a copy of the caller's context, like prefetch_map's pages
+        futures = {pool.submit(contextvars.copy_context().run, search_stage, service, stage, search_term): stage
+                   for stage in stages}
+        for future in as_completed(futures):
+            try:
+                headers, matches = future.result()
+                yield futures[future], headers, matches, None
+            except Exception as e:
+                yield futures[future], None, [], e
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def scan_lookup(service, spreadsheet_id, tab, header_row, find_key_columns, code):
+    """Exact lookup of a scanned code through the snapshot's key index, same match shape as the searches"""
+    try:
+        snapshot = read_tab(service, spreadsheet_id, tab, header_row)
+        values = snapshot.values
         if not values:
-            return None, None, []
+            return []
         
         headers = values[0]
-        data_rows = values[1:]
-        
-        # Find matching rows
-        matches = []
-        for idx, row in enumerate(data_rows):
-            row_extended = row + [''] * (len(headers) - len(row))
-            for cell in row_extended:
-                if search_term.lower() in str(cell).lower():
-                    matches.append({
-                        'row_index': idx + 2,  # +2 because headers at row 1, data starts row 2
-                        'data': dict(zip(headers, row_extended))
-                    })
-                    break
+        key_columns = find_key_columns(headers)
+        if not key_columns:
+            return []
         
-        return headers, data_rows, matches
+        return snapshot.matches(snapshot.key_index(key_columns).lookup(code))
     except HttpError as e:
         if e.resp.status == 403:
             st.error("❌ Aapko is sheet ka access nahi hai. Sheet owner se permission lein.")
         else:
             st.error(f"Error: {str(e)}")
-        return None, None, []
+        return []
 
-def mark_handover(service, row_index, user_name):
-    """Mark order as handed over with note"""
+@tagged
+def scan_handover(service, code):
+    """Find a scanned Order No in the Handover sheet"""
+    return scan_lookup(service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW,
+                       find_handover_key_columns, code)
+
+@tagged
+def scan_bundling(service, code):
+    """Find a scanned Fleek/Order ID or Bundle ID in the Bundling sheet"""
+    return scan_lookup(service, BUNDLING_SHEET_ID, BUNDLING_TAB, BUNDLING_HEADER_ROW,
+                       find_bundling_key_columns, code)
+
+@tagged
+def mark_handover(service, row_index, user_name, order_no=None):
+    """Mark order as handed over with note; order_no is checked against the row first"""
     try:
-        # Get sheet ID for notes
-        spreadsheet = service.spreadsheets().get(spreadsheetId=HANDOVER_SHEET_ID).execute()
-        sheet_id = None
-        for sheet in spreadsheet['sheets']:
-            if sheet['properties']['title'] == HANDOVER_TAB:
-                sheet_id = sheet['properties']['sheetId']
-                break
-        
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         note_text = f"Handed over by {user_name} on {timestamp}"
         
-        # Update Handedover Status column (find column index)
-        result = service.spreadsheets().values().get(
-            spreadsheetId=HANDOVER_SHEET_ID,
-            range=f"'{HANDOVER_TAB}'!A3:Z3"
-        ).execute()
-        headers = result.get('values', [[]])[0]
-        
-        handover_col_idx = None
-        for idx, header in enumerate(headers):
-            if 'handedover' in header.lower() or 'handed' in header.lower():
-                handover_col_idx = idx
-                break
-        
+        # Value and note go out in a single batchUpdate, after checking the row still holds the order
+        handover_col_idx = write_status_cell(
+            service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW,
+            find_handover_column, row_index, 'Done', note_text, find_order_column, order_no
+        )
         if handover_col_idx is None:
             st.error("Handedover Status column not found")
             return False
         
-        # Convert to column letter
-        col_letter = chr(65 + handover_col_idx) if handover_col_idx < 26 else chr(64 + handover_col_idx // 26) + chr(65 + handover_col_idx % 26)
-        
-        # Update cell value
-        service.spreadsheets().values().update(
-            spreadsheetId=HANDOVER_SHEET_ID,
-            range=f"'{HANDOVER_TAB}'!{col_letter}{row_index}",
-            valueInputOption='USER_ENTERED',
-            body={'values': [['Done']]}
-        ).execute()
-        
-        # Add note to cell
-        if sheet_id is not None:
-            requests = [{
-                'updateCells': {
-                    'range': {
-                        'sheetId': sheet_id,
-                        'startRowIndex': row_index - 1,
-                        'endRowIndex': row_index,
-                        'startColumnIndex': handover_col_idx,
-                        'endColumnIndex': handover_col_idx + 1
-                    },
-                    'rows': [{
-                        'values': [{
-                            'note': note_text
-                        }]
-                    }],
-                    'fields': 'note'
-                }
-            }]
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=HANDOVER_SHEET_ID,
-                body={'requests': requests}
-            ).execute()
-        
         return True
     except Exception as e:
+        get_snapshot_cache().invalidate(HANDOVER_SHEET_ID, HANDOVER_TAB)
         st.error(f"Error marking handover: {str(e)}")
         return False
 
-def mark_bundling_status(service, row_index, status, user_name):
-    """Mark bundling order status"""
+@tagged
+def queue_handover(service, row_index, user_name, order_no=None):
+    """Queue a handover for the background writer; returns the ticket or None"""
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        note_text = f"Handed over by {user_name} on {timestamp}"
+        ticket = queue_status_write(
+            service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW,
+            find_handover_column, row_index, 'Done', note_text, find_order_column, order_no
+        )
+        if ticket is None:
+            st.error("Handedover Status column not found")
+        return ticket
+    except Exception as e:
+        st.error(f"Error marking handover: {str(e)}")
+        return None
+
+@tagged
+def mark_bundling_status(service, row_index, status, user_name, order_id=None):
+    """Mark bundling order status; order_id (Fleek/Order ID) is checked against the row first"""
     try:
-        # Get sheet ID
-        spreadsheet = service.spreadsheets().get(spreadsheetId=BUNDLING_SHEET_ID).execute()
-        sheet_id = None
-        for sheet in spreadsheet['sheets']:
-            if sheet['properties']['title'] == BUNDLING_TAB:
-                sheet_id = sheet['properties']['sheetId']
-                break
-        
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         note_text = f"Marked '{status}' by {user_name} on {timestamp}"
         
-        # Get headers to find Packing Status column
-        result = service.spreadsheets().values().get(
-            spreadsheetId=BUNDLING_SHEET_ID,
-            range=f"'{BUNDLING_TAB}'!A1:Z1"
-        ).execute()
-        headers = result.get('values', [[]])[0]
-        
-        packing_col_idx = None
-        for idx, header in enumerate(headers):
-            if 'packing' in header.lower() and 'status' in header.lower():
-                packing_col_idx = idx
-                break
-        
+        # Value and note go out in a single batchUpdate, after checking the row still holds the order
+        packing_col_idx = write_status_cell(
+            service, BUNDLING_SHEET_ID, BUNDLING_TAB, BUNDLING_HEADER_ROW,
+            find_packing_column, row_index, status, note_text, find_fleek_id_column, order_id
+        )
         if packing_col_idx is None:
             st.error("Packing Status column not found")
             return False
         
-        col_letter = chr(65 + packing_col_idx) if packing_col_idx < 26 else chr(64 + packing_col_idx // 26) + chr(65 + packing_col_idx % 26)
-        
-        # Update cell value
-        service.spreadsheets().values().update(
-            spreadsheetId=BUNDLING_SHEET_ID,
-            range=f"'{BUNDLING_TAB}'!{col_letter}{row_index}",
-            valueInputOption='USER_ENTERED',
-            body={'values': [[status]]}
-        ).execute()
-        
-        # Add note
-        if sheet_id is not None:
-            requests = [{
-                'updateCells': {
-                    'range': {
-                        'sheetId': sheet_id,
-                        'startRowIndex': row_index - 1,
-                        'endRowIndex': row_index,
-                        'startColumnIndex': packing_col_idx,
-                        'endColumnIndex': packing_col_idx + 1
-                    },
-                    'rows': [{
-                        'values': [{
-                            'note': note_text
-                        }]
-                    }],
-                    'fields': 'note'
-                }
-            }]
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=BUNDLING_SHEET_ID,
-                body={'requests': requests}
-            ).execute()
-        
         return True
     except Exception as e:
+        get_snapshot_cache().invalidate(BUNDLING_SHEET_ID, BUNDLING_TAB)
         st.error(f"Error marking bundling status: {str(e)}")
         return False
 
-def get_pending_handover(service):
-    """Get pending handover orders"""
+@tagged
+def mark_handover_bulk(service, order_rows, user_name):
+    """Mark many orders as handed over with chunked batchUpdates
+
+    order_rows maps row_index to the Order No expected there. Returns
+    ({row_index: error or None}, {row_index: row it had moved to}).
+    """
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    note_text = f"Handed over by {user_name} on {timestamp}"
     try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=HANDOVER_SHEET_ID,
-            range=f"'{HANDOVER_TAB}'!A3:Z1000"
-        ).execute()
-        
-        values = result.get('values', [])
-        if not values:
-            return []
-        
-        headers = values[0]
-        data_rows = values[1:]
-        
-        # Find handover status column
-        handover_col_idx = None
-        for idx, header in enumerate(headers):
-            if 'handedover' in header.lower() or 'handed' in header.lower():
-                handover_col_idx = idx
-                break
-        
-        if handover_col_idx is None:
-            return []
+        handover_col_idx, results, moved = write_status_cells(
+            service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW, find_handover_column,
+            [(row_index, 'Done', note_text, order_no or None) for row_index, order_no in order_rows.items()],
+            find_order_column
+        )
+    except Exception as e:
+        get_snapshot_cache().invalidate(HANDOVER_SHEET_ID, HANDOVER_TAB)
+        st.error(f"Error marking handover: {str(e)}")
+        return None
+    
+    if handover_col_idx is None:
+        st.error("Handedover Status column not found")
+        return None
+    if any(error is not None for error in results.values()):
+        get_snapshot_cache().invalidate(HANDOVER_SHEET_ID, HANDOVER_TAB)
+    return results, moved
+
+def parse_order_numbers(text):
+    """Split pasted or scanned order numbers on newlines, commas, semicolons and tabs"""
+    order_nos = []
+    for part in re.split(r'[\n,;\t]+', text or ''):
+        part = part.strip()
+        if part and part not in order_nos:
+            order_nos.append(part)
+    return order_nos
+
+@tagged
+def find_handover_rows(service, order_nos):
+    """Look up order numbers in the handover sheet: {order_no: (row_index, status)}"""
+    values = read_tab(service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW).values
+    if not values:
+        return {}
+    
+    headers = values[0]
+    order_col_idx = find_order_column(headers)
+    handover_col_idx = find_handover_column(headers)
+    if order_col_idx is None:
+        return {}
+    
+    wanted = {order_no.strip().lower(): order_no for order_no in order_nos}
+    found = {}
+    for pos in range(1, len(values)):
+        key = values.cell(pos, order_col_idx).strip().lower()
+        if key in wanted and wanted[key] not in found:
+            status = values.cell(pos, handover_col_idx) if handover_col_idx is not None else ''
+            found[wanted[key]] = (pos + HANDOVER_HEADER_ROW, status)
+    return found
+
+@tagged
+def queue_bundling_status(service, row_index, status, user_name, order_id=None):
+    """Queue a bundling status for the background writer; returns the ticket or None"""
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        note_text = f"Marked '{status}' by {user_name} on {timestamp}"
+        ticket = queue_status_write(
+            service, BUNDLING_SHEET_ID, BUNDLING_TAB, BUNDLING_HEADER_ROW,
+            find_packing_column, row_index, status, note_text, find_fleek_id_column, order_id
+        )
+        if ticket is None:
+            st.error("Packing Status column not found")
+        return ticket
+    except Exception as e:
+        st.error(f"Error marking bundling status: {str(e)}")
+        return None
+
+def handover_pending_index(snapshot):
+    """The snapshot's maintained pending set, or None without a Handedover Status column"""
+    if not snapshot.values:
+        return None
+    headers = snapshot.values[0]
+    status_col = find_handover_column(headers)
+    if status_col is None:
+        return None
+    return snapshot.pending_index(status_col, find_vendor_column(headers), find_date_column(headers),
+                                  HANDOVER_DONE_STATUSES)
+
+def age_in_days(date_value, today):
+    """Days between a sheet date cell and today's ordinal, None if it doesn't parse"""
+    ordinal = parse_sheet_date(date_value)
+    return None if ordinal is None else today - ordinal
+
+def pending_item(headers, row_index, row, today):
+    """Pending-list entry from a mirror row: the row as a dict plus how many days old its date is"""
+    row_extended = row + [''] * (len(headers) - len(row))
+    data = dict(zip(headers, row_extended))
+    date_col = find_date_column(headers)
+    data['Age (days)'] = age_in_days(row_extended[date_col], today) if date_col is not None else None
+    return {'row_index': row_index, 'data': data}
+
+@tagged
+def get_pending_handover(service, sort='Sheet order', search_term='', offset=0, limit=None):
+    """One page of pending handover orders: (number pending after filtering, items)"""
+    try:
+        today = datetime.now().toordinal()
+        mirror = mirror_for(HANDOVER_SHEET_ID, HANDOVER_TAB)
+        if mirror is not None:
+            headers, total, found = mirror.pending(HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_DONE_STATUSES,
+                                                   search_term, sort, offset, limit)
+            return total, [pending_item(headers, row_index, row, today) for row_index, row in found]
         
-        # Find pending orders
-        pending = []
-        for idx, row in enumerate(data_rows):
-            row_extended = row + [''] * (len(headers) - len(row))
-            status = row_extended[handover_col_idx] if handover_col_idx < len(row_extended) else ''
-            if status.lower() not in ['done', 'completed', 'yes']:
-                pending.append({
-                    'row_index': idx + 4,
-                    'data': dict(zip(headers, row_extended))
-                })
+        snapshot = read_tab(service, HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_HEADER_ROW)
+        pending_index = handover_pending_index(snapshot)
+        if pending_index is None:
+            return 0, []
         
-        return pending[:50]  # Return max 50
+        # Only the requested page gets row views; the set itself is maintained incrementally
+        allowed = set(snapshot.search_index().search(search_term)) if search_term else None
+        total, positions = pending_index.page(sort, allowed, offset, limit)
+        # Page entries are row views over the shared snapshot, with the age computed alongside
+        date_col = find_date_column(snapshot.values[0])
+        return total, [
+            {'row_index': pos + HANDOVER_HEADER_ROW + 1,
+             'data': snapshot.row_view(pos, extra={'Age (days)': age_in_days(
+                 snapshot.values.cell(pos + 1, date_col), today) if date_col is not None else None})}
+            for pos in positions
+        ]
     except Exception as e:
         st.error(f"Error getting pending list: {str(e)}")
-        return []
+        return 0, []
+
+def get_pending_count():
+    """Live number of pending handovers from data already loaded, or None; never calls Sheets"""
+    mirror = mirror_for(HANDOVER_SHEET_ID, HANDOVER_TAB)
+    if mirror is not None:
+        return mirror.pending_count(HANDOVER_SHEET_ID, HANDOVER_TAB, HANDOVER_DONE_STATUSES)
+    snapshot = get_snapshot_cache().peek(HANDOVER_SHEET_ID, tab_range(HANDOVER_TAB, HANDOVER_HEADER_ROW))
+    pending_index = handover_pending_index(snapshot) if snapshot is not None else None
+    return None if pending_index is None else len(pending_index)
+
+# ============== EXPORT ==============
+
+def export_filter(spec, headers):
+    """Row predicate for an export spec; ValueError if the sheet can't answer it"""
+    stage, kind, query = spec['stage'], spec['kind'], spec.get('query', '')
+    if kind == 'search':
+        # Same rules as the search box: field:value clauses if there are any, else substring
+        clauses, free_text = parse_field_query(query)
+        resolved = resolve_query_fields(clauses, headers)
+        free_text = free_text if clauses else query
+        return lambda row: row_matches_query(row, resolved, free_text)
+
+    status_col = STAGE_COLUMNS[stage][1](headers)
+    if status_col is None:
+        raise ValueError(f"No status column in the {stage.lower()} sheet")
+    if kind == 'pending':
+        # Same rules as the pending list: non-blank rows not yet handed over
+        done, term = frozenset(HANDOVER_DONE_STATUSES), query.lower()
+        return lambda row: (any(str(cell).strip() for cell in row)
+                            and PendingIndex._cell(row, status_col).strip().lower() not in done
+                            and (not term or any(term in str(cell).lower() for cell in row)))
+    if kind == 'status':
+        wanted = frozenset(status.strip().lower() for status in spec['statuses'])
+        return lambda row: (any(str(cell).strip() for cell in row)
+                            and PendingIndex._cell(row, status_col).strip().lower() in wanted)
+    raise ValueError(f"Unknown export: {kind}")
+
+def export_chunks(service, spec, chunk_rows=None):
+    """(headers, generator of row chunks) for an export spec, each row led by its sheet row number
+
+    Rows come from the tab's cached snapshot while it is fresh, else straight from Sheets
+    a page at a time without filling the cache; either way only the current page and the
+    rows kept from it exist at once.
+    """
+    chunk_rows = chunk_rows or EXPORT_CHUNK_ROWS
+    spreadsheet_id, tab, header_row = SEARCH_STAGES[spec['stage']]
+    cache = get_snapshot_cache()
+    snapshot = cache.peek(spreadsheet_id, tab_range(tab, header_row))
+    if snapshot is not None and snapshot.age() < cache.ttl and snapshot.values:
+        values = snapshot.values
+        headers = values[0]
+        # Slicing decodes just that page; values[pos] is sheet row header_row + pos
+        pages = ((header_row + pos, values[pos:pos + chunk_rows]) for pos in range(1, len(values), chunk_rows))
+    else:
+        # One worker: a prefetching pool would hold several fetched pages besides the one being encoded
+        pages = iter_sheet_chunks(service, spreadsheet_id, tab, header_row, chunk_rows, workers=1,
+                                  priority=PRIORITY_BACKGROUND)
+        # The first page starts at the header row, so the headers always match the rows below them
+        first = next(pages, None)
+        headers = first[1][0] if first is not None and first[1] else []
+        pages = itertools.chain([first] if first is not None else [], pages)
+    keep = export_filter(spec, headers)
+
+    def chunks():
+        for start, page in pages:
+            chunk = [[start + n, *row] for n, row in enumerate(page) if start + n > header_row and keep(row)]
+            if chunk:
+                yield chunk
+    return headers, chunks()
+
+def export_columns(headers):
+    """Export column names: Row, then the headers made unique and non-empty as Parquet needs"""
+    names, seen = ['Row'], {'Row'}
+    for col_idx, header in enumerate(headers):
+        base = str(header).strip() or f"Column {column_letter(col_idx)}"
+        name, copy = base, 2
+        while name in seen:
+            name, copy = f"{base} ({copy})", copy + 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+def csv_chunks(headers, chunks):
+    """CSV bytes a chunk at a time, with a BOM so Excel opens it as UTF-8"""
+    columns = export_columns(headers)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    yield buffer.getvalue().encode('utf-8')
+    for chunk in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(row + [''] * (len(columns) - len(row)) for row in chunk)
+        yield buffer.getvalue().encode('utf-8')
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file that hands back what was written since the last drain"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+def parquet_chunks(headers, chunks):
+    """Parquet bytes a chunk at a time: one row group per chunk, the footer last"""
+    columns = export_columns(headers)
+    schema = pa.schema([('Row', pa.int64())] + [(name, pa.string()) for name in columns[1:]])
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for chunk in chunks:
+            # Transpose the chunk into columns, padding short rows with blanks
+            arrays = [[row[col_idx] if col_idx < len(row) else '' for row in chunk]
+                      for col_idx in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+# Download formats: name -> (file extension, content type, encoder)
+EXPORT_FORMATS = {'CSV': ('csv', 'text/csv', csv_chunks)}
+if pq is not None:
+    EXPORT_FORMATS['Parquet'] = ('parquet', 'application/vnd.apache.parquet', parquet_chunks)
+
+def export_file_name(spec, fmt):
+    """Download file name, e.g. handover-pending-20260417-0930.csv"""
+    extension = EXPORT_FORMATS[fmt][0]
+    return f"{spec['stage'].lower()}-{spec['kind']}-{datetime.now().strftime('%Y%m%d-%H%M')}.{extension}"
+
+def export_stream(service, spec, fmt):
+    """Encoded export as a generator of byte chunks; raises before the first chunk if it can't start"""
+    headers, chunks = export_chunks(service, spec)
+    return EXPORT_FORMATS[fmt][2](headers, chunks)
+
+@tagged
+def export_bytes(service, spec, fmt):
+    """Whole export in memory, for the download button when no endpoint is there to stream it
+
+    Raises ValueError once it passes EXPORT_MEMORY_MAX_ROWS rows rather than hold more.
+    """
+    headers, chunks = export_chunks(service, spec)
+
+    def capped():
+        count = 0
+        for chunk in chunks:
+            count += len(chunk)
+            if count > EXPORT_MEMORY_MAX_ROWS:
+                raise ValueError(f"Export is over {EXPORT_MEMORY_MAX_ROWS} rows; narrow it or enable streaming downloads")
+            yield chunk
+    return b''.join(EXPORT_FORMATS[fmt][2](headers, capped()))
+
+def current_session_id():
+    """Id of the browser session running this script, or None outside one"""
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def session_alive(session_id):
+    """Whether a browser session is still connected; always true without a server runtime (bare runs)"""
+    return session_id is None or not Runtime.exists() or Runtime.instance().is_active_session(session_id)
+
+class ExportLinks:
+    """Short-lived, single-use download tokens, each naming the session's service and what to export
+
+    A token is a bearer URL for its user's Google credentials, so it is bound to the
+    session that made it (dead once that session is gone), works for one download,
+    and is revoked with the rest of its user's tokens at logout.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # token -> (expires, owner, session id, service, spec, format)
+        self._links = {}
+
+    def create(self, owner, session_id, service, spec, fmt):
+        token = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        with self._lock:
+            self._links = {key: link for key, link in self._links.items() if link[0] > now}
+            self._links[token] = (now + self.ttl, owner, session_id, service, spec, fmt)
+        return token
+
+    def is_live(self, token):
+        with self._lock:
+            link = self._links.get(token)
+        return link is not None and link[0] > time.monotonic()
+
+    def take(self, token):
+        """(service, spec, format) of a live token, using it up; None if unknown, used, expired or orphaned"""
+        with self._lock:
+            link = self._links.pop(token, None)
+        if link is None or link[0] <= time.monotonic() or not session_alive(link[2]):
+            return None
+        return link[3:]
+
+    def revoke(self, owner):
+        """Forget every token of a user, e.g. when they log out"""
+        with self._lock:
+            self._links = {key: link for key, link in self._links.items() if link[1] != owner}
+
+
+class ExportHandler(http.server.BaseHTTPRequestHandler):
+    """GET /export/<token>: streams the export as it is read, with chunked transfer encoding
+
+    Chunked encoding lets the browser tell a finished download from one cut short by a
+    Sheets error part way through: only a complete export ends with the final empty chunk.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        prefix = '/export/'
+        link = get_export_links().take(self.path[len(prefix):]) if self.path.startswith(prefix) else None
+        if link is None:
+            self.send_error(404, "Export link already used or expired; export again from the app")
+            return
+        service, spec, fmt = link
+        # Each request has its own thread, so this tags every Sheets call the export makes
+        CALL_TAG.set('export_download')
+        try:
+            body = export_stream(service, spec, fmt)
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        except HttpError as e:
+            self.send_error(e.resp.status, "Sheets error while starting the export")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', EXPORT_FORMATS[fmt][1])
+        self.send_header('Content-Disposition', f'attachment; filename="{export_file_name(spec, fmt)}"')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        try:
+            for data in body:
+                if data:
+                    self.wfile.write(b'%X\r\n%s\r\n' % (len(data), data))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The download was cancelled: stop reading the sheet
+            body.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def get_export_links():
+    """Process-wide export tokens; starts the download endpoint if EXPORT_PORT is set"""
+    links = ExportLinks(EXPORT_LINK_SECONDS)
+    if EXPORT_PORT:
+        server = http.server.ThreadingHTTPServer((EXPORT_HOST, EXPORT_PORT), ExportHandler)
+        threading.Thread(target=server.serve_forever, name='export-endpoint', daemon=True).start()
+    return links
 
 # ============== MAIN APP ==============
 
+def track_ticket(ticket):
+    """Remember a queued write so the sidebar can show how it went"""
+    if ticket is not None:
+        st.session_state.setdefault('write_tickets', []).append(ticket.id)
+    return ticket
+
+def match_targets(matches, find_key_column):
+    """(row_index, identity cell) of each match: the Order No the operator saw, checked again before writing"""
+    targets = []
+    for match in matches:
+        headers = list(match['data'])
+        key_col = find_key_column(headers)
+        order_key = match['data'][headers[key_col]] if key_col is not None else ''
+        targets.append((match['row_index'], order_key or None))
+    return targets
+
+def queue_selected(key, queue_fn, service, targets, *args):
+    """Action-button callback: queue queue_fn for every selected (row_index, order key) and leave a message for the panel
+
+    It runs before the panel reruns, so the table already shows the optimistic new status.
+    """
+    queued = sum(1 for row_index, order_key in targets
+                 if track_ticket(queue_fn(service, row_index, *args, order_key)))
+    st.session_state[f"{key}_flash"] = queued
+
+def results_table(key, headers, matches, default_columns, total=None):
+    """Paged table of matches with row selection; returns the selected matches
+
+    Only the current page is turned into table rows, so the cost of a rerun doesn't grow
+    with the number of matches. The selection resets whenever the rows on the page change,
+    so a selection can never slide onto a different order. With total given, matches is
+    already the current page of a server-side result set of that size (see paged_query).
+    """
+    headers = headers or (list(matches[0]['data']) if matches else [])
+    columns_key, page_key = f"{key}_columns", f"{key}_page"
+    if columns_key not in st.session_state:
+        st.session_state[columns_key] = [column for column in default_columns if column in headers] or headers[:6]
+    pages = max(1, -(-(len(matches) if total is None else total) // RESULTS_PAGE_SIZE))
+    st.session_state[page_key] = min(max(1, st.session_state.get(page_key, 1)), pages)
+
+    option_col, page_col = st.columns([3, 1])
+    with option_col:
+        columns = st.multiselect("Columns", headers, key=columns_key) or headers[:6]
+    with page_col:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+
+    start = (page - 1) * RESULTS_PAGE_SIZE
+    if total is None:
+        total = len(matches)
+        page_matches = matches[start:start + RESULTS_PAGE_SIZE]
+    else:
+        page_matches = matches
+    table = [
+        {'Row': match['row_index'], **{column: match['data'].get(column, '') for column in columns}}
+        for match in page_matches
+    ]
+    st.caption(f"Rows {start + 1}–{start + len(page_matches)} of {total} · select rows to act on them")
+    page_signature = hashlib.sha1(repr([match['row_index'] for match in page_matches]).encode()).hexdigest()[:12]
+    event = st.dataframe(table, key=f"{key}_table_{page_signature}", on_select="rerun",
+                         selection_mode="multi-row", hide_index=True, use_container_width=True)
+    selected = [page_matches[pos] for pos in event.selection.rows if pos < len(page_matches)]
+    if len(selected) == 1:
+        # The full record of a single selection, as the old expanders showed it
+        st.dataframe([{'Field': field, 'Value': value} for field, value in selected[0]['data'].items()],
+                     hide_index=True, use_container_width=True)
+    return selected
+
+def reset_results(key):
+    """Start a new result set on its first page"""
+    st.session_state.pop(f"{key}_page", None)
+
+def paged_query(key, fetch):
+    """fetch(offset, limit) -> (total, items) for the page results_table(key) is on, clamped to the last page"""
+    page = max(1, st.session_state.get(f"{key}_page", 1))
+    total, items = fetch((page - 1) * RESULTS_PAGE_SIZE, RESULTS_PAGE_SIZE)
+    last = max(1, -(-total // RESULTS_PAGE_SIZE))
+    if page > last:
+        # The set shrank under us (orders handed over elsewhere): show its new last page
+        page = last
+        total, items = fetch((page - 1) * RESULTS_PAGE_SIZE, RESULTS_PAGE_SIZE)
+    st.session_state[f"{key}_page"] = page
+    return total, items
+
+def export_link(key, service, spec, fmt):
+    """URL of a streaming download for spec; a new token once the last one is used or half expired"""
+    state_key = f"{key}_export_link"
+    signature = (repr(spec), fmt)
+    links = get_export_links()
+    saved = st.session_state.get(state_key)
+    if (saved is None or saved[0] != signature or not links.is_live(saved[1])
+            or time.monotonic() - saved[2] > EXPORT_LINK_SECONDS / 2):
+        token = links.create(credentials_key(st.session_state['credentials']), current_session_id(),
+                             service, spec, fmt)
+        saved = st.session_state[state_key] = (signature, token, time.monotonic())
+    return f"{EXPORT_PUBLIC_URL}/export/{saved[1]}"
+
+def export_controls(key, service, spec, label, rows=None):
+    """Format picker and download button for an export spec of rows rows (None: not known)
+
+    With the export endpoint running the button is a link the endpoint streams from a
+    chunk at a time; without it the file is built in memory when the button is clicked,
+    so exports over EXPORT_MEMORY_MAX_ROWS rows are refused.
+    """
+    if not EXPORT_PORT and rows is not None and rows > EXPORT_MEMORY_MAX_ROWS:
+        st.caption(f"⬇️ {rows} rows is too many to export here (limit {EXPORT_MEMORY_MAX_ROWS}); "
+                   "narrow it down, or ask an admin to enable streaming downloads")
+        return
+    format_col, download_col = st.columns([1, 3])
+    with format_col:
+        fmt = st.selectbox("Export format", list(EXPORT_FORMATS), key=f"{key}_export_format",
+                           label_visibility="collapsed")
+    with download_col:
+        if EXPORT_PORT:
+            st.link_button(f"⬇️ {label}", export_link(key, service, spec, fmt))
+        else:
+            st.download_button(f"⬇️ {label}", functools.partial(export_bytes, service, spec, fmt),
+                               file_name=export_file_name(spec, fmt), mime=EXPORT_FORMATS[fmt][1],
+                               key=f"{key}_export", on_click="ignore")
+
+TICKET_ICONS = {'queued': '⏳', 'committing': '📤', 'committed': '✅', 'failed': '❌', 'coalesced': '↪️'}
+
+@st.fragment(run_every=2)
+def write_queue_panel():
+    """Sidebar panel with queue depth and this operator's recent writes; refreshes on its own"""
+    write_queue = get_write_queue()
+    queue_stats = write_queue.stats()
+    st.caption(f"Queue depth: {queue_stats['depth']} · Committed: {queue_stats['committed']} · "
+               f"Failed: {queue_stats['failed']} · Retries: {queue_stats['retried']}")
+    for ticket_id in reversed(st.session_state.get('write_tickets', [])[-10:]):
+        ticket = write_queue.ticket(ticket_id)
+        if ticket is None:
+            continue
+        line = f"{TICKET_ICONS.get(ticket.state, '')} Row {ticket.row_index} → {ticket.value} ({ticket.state})"
+        if ticket.moved_from is not None:
+            line += f" — order had moved from row {ticket.moved_from}"
+        if ticket.error is not None and ticket.state != 'committed':
+            line += f" — {ticket.error}"
+        st.caption(line)
+
+def performance_panel():
+    """Where the time went over the metrics window: Sheets round trips, quota waits, rendering"""
+    metrics = get_metrics()
+    summary = metrics.summary()
+    totals = {}
+    for row in summary:
+        if row['metric'] != 'sheets_response_bytes':
+            totals[row['metric']] = totals.get(row['metric'], 0.0) + row['total']
+    st.caption(f"Last {METRICS_WINDOW_SECONDS / 60:.0f} min — Sheets: {totals.get('sheets_request_seconds', 0.0):.1f}s · "
+               f"Quota wait: {totals.get('sheets_wait_seconds', 0.0):.1f}s · "
+               f"Rendering: {totals.get('render_seconds', 0.0):.1f}s")
+    table = []
+    for row in summary:
+        if row['metric'] == 'sheets_wait_seconds' and row['mean'] < 0.001:
+            # Requests that went straight through; only real waits are worth a row
+            continue
+        is_bytes = row['metric'] == 'sheets_response_bytes'
+        scale, unit = (1 / 1024, 'KB') if is_bytes else (1000, 'ms')
+        table.append({
+            'Metric': row['metric'],
+            'Caller': row.get('caller', row.get('view', '')),
+            'Detail': " ".join(str(row[label]) for label in ('method', 'status', 'kind', 'reason') if label in row),
+            'Count': row['count'],
+            'Mean': f"{row['mean'] * scale:.1f} {unit}",
+            'p95': f"{row['p95'] * scale:.1f} {unit}",
+        })
+    if table:
+        st.dataframe(table, use_container_width=True, hide_index=True)
+    st.download_button("⬇️ Prometheus", metrics.prometheus(), file_name="warehouse_metrics.prom",
+                       mime="text/plain", use_container_width=True)
+    st.download_button("⬇️ JSON", json.dumps(summary, indent=1), file_name="warehouse_metrics.json",
+                       mime="application/json", use_container_width=True)
+
+def run_bulk_handover(service, user_name, pending_orders):
+    """Bulk handover button callback: write selected and pasted orders, store a per-row report"""
+    order_rows = {}
+    report = []
+    for row_index in st.session_state.get('bulk_selected', []):
+        order_rows[row_index] = pending_orders.get(row_index)
+    
+    order_nos = parse_order_numbers(st.session_state.get('bulk_orders', ''))
+    found = find_handover_rows(service, order_nos) if order_nos else {}
+    for order_no in order_nos:
+        if order_no not in found:
+            report.append({'Order No': order_no, 'Row': None, 'Result': '❌ Not found'})
+            continue
+        row_index, status = found[order_no]
+        if status.lower() in HANDOVER_DONE_STATUSES:
+            report.append({'Order No': order_no, 'Row': row_index, 'Result': '⏭️ Already handed over'})
+        elif row_index not in order_rows:
+            order_rows[row_index] = order_no
+    
+    if order_rows:
+        outcome = mark_handover_bulk(service, order_rows, user_name)
+        if outcome is None:
+            return
+        results, moved = outcome
+        for row_index, order_no in order_rows.items():
+            error = results.get(row_index)
+            result = '✅ Handed over' if error is None else f"❌ Failed: {error}"
+            if row_index in moved:
+                result += f" (had moved from row {row_index})"
+            report.append({'Order No': order_no or 'N/A', 'Row': moved.get(row_index, row_index), 'Result': result})
+    
+    st.session_state['bulk_report'] = report
+    st.session_state['bulk_selected'] = []
+    st.session_state['bulk_orders'] = ''
+
+def handover_results(prefix, service, user_name, headers, matches, summary, query):
+    """Handover matches as a selectable table (key f"{prefix}_results") with the Mark Handover and export actions"""
+    key = f"{prefix}_results"
+    flash = st.session_state.pop(f"{key}_flash", None)
+    if flash:
+        st.success(f"⏳ {flash} handover(s) by {user_name} queued")
+        st.balloons()
+    if not matches:
+        st.warning("❌ No results found")
+        return
+    st.success(summary)
+    export_controls(key, service, {'stage': 'Handover', 'kind': 'search', 'query': query},
+                    f"Export {len(matches)} result(s)", len(matches))
+    with render_timer(key):
+        selected = results_table(key, headers, matches, HANDOVER_RESULT_COLUMNS)
+    if selected:
+        st.button(f"✅ Mark Handover ({len(selected)})", key=f"{prefix}_mark_selected", type="primary",
+                  on_click=queue_selected,
+                  args=(key, queue_handover, service, match_targets(selected, find_order_column), user_name))
+
+def bundling_results(prefix, service, user_name, headers, matches, summary, query):
+    """Bundling matches as a selectable table (key f"{prefix}_results") with the status and export actions"""
+    key = f"{prefix}_results"
+    flash = st.session_state.pop(f"{key}_flash", None)
+    if flash:
+        st.success(f"⏳ {flash} status update(s) queued")
+    if not matches:
+        st.warning("❌ No results found")
+        return
+    st.success(summary)
+    export_controls(key, service, {'stage': 'Bundling', 'kind': 'search', 'query': query},
+                    f"Export {len(matches)} result(s)", len(matches))
+    with render_timer(key):
+        selected = results_table(key, headers, matches, BUNDLING_RESULT_COLUMNS)
+    if selected:
+        targets = match_targets(selected, find_fleek_id_column)
+        status_col1, status_col2, status_col3 = st.columns(3)
+        for column, (label, status) in zip((status_col1, status_col2, status_col3),
+                                           [("✅ Packed", "Packed"), ("⏸️ Hold", "Hold"), ("❌ Issue", "Issue")]):
+            with column:
+                st.button(f"{label} ({len(selected)})", key=f"{prefix}_{status.lower()}_selected",
+                          use_container_width=True, on_click=queue_selected,
+                          args=(key, queue_bundling_status, service, targets, status, user_name))
+
+@st.fragment
+def search_panel(service, user_name):
+    """🔍 Search & Handover tab; its widgets rerun only this panel"""
+    st.markdown("### Search Order")
+    search_col1, search_col2 = st.columns([3, 1])
+    with search_col1:
+        search_term = st.text_input("Enter Order No, Vendor, or any keyword", key="handover_search",
+                                    help="Narrow down with field:value clauses, e.g. `vendor:acme status:done order:123*`")
+    with search_col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        search_btn = st.button("🔍 Search", key="handover_search_btn", use_container_width=True)
+
+    # The query outlives the button press, so the results (and their actions) survive reruns
+    if search_btn and search_term:
+        st.session_state['handover_query'] = search_term
+        reset_results('handover_results')
+    query = st.session_state.get('handover_query')
+    if not query:
+        return
+
+    with st.spinner("Searching..."):
+        headers, data, matches = search_handover(service, query)
+
+    handover_results('handover', service, user_name, headers, matches,
+                     f"✅ Found {len(matches)} result(s) for '{query}'", query)
+
+@st.fragment
+def bundling_panel(service, user_name):
+    """📦 Bundling tab; its widgets rerun only this panel"""
+    st.markdown("### Search Bundling Order")
+    bcol1, bcol2 = st.columns([3, 1])
+    with bcol1:
+        bundling_search = st.text_input("Enter Order ID, Bundle ID, or Customer", key="bundling_search",
+                                        help="Narrow down with field:value clauses, e.g. `customer:\"ali khan\" status:hold bundle:b-12*`")
+    with bcol2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        bundling_btn = st.button("🔍 Search", key="bundling_search_btn", use_container_width=True)
+
+    with st.expander("⬇️ Export by status"):
+        # Blank Packing Status means not bundled yet
+        statuses = st.multiselect("Packing Status", ['Not set'] + BUNDLING_STATUSES, default=['Not set'],
+                                  key="bundling_export_statuses")
+        if statuses:
+            spec = {'stage': 'Bundling', 'kind': 'status',
+                    'statuses': ['' if status == 'Not set' else status for status in statuses]}
+            export_controls('bundling_status', service, spec, f"Export {', '.join(statuses)} rows")
+
+    if bundling_btn and bundling_search:
+        st.session_state['bundling_query'] = bundling_search
+        reset_results('bundling_results')
+    query = st.session_state.get('bundling_query')
+    if not query:
+        return
+
+    with st.spinner("Searching..."):
+        headers, data, matches = search_bundling(service, query)
+
+    bundling_results('bundling', service, user_name, headers, matches,
+                     f"✅ Found {len(matches)} result(s) for '{query}'", query)
+
+# How Find Anywhere shows each stage's matches
+STAGE_RESULTS = {'Handover': handover_results, 'Bundling': bundling_results}
+
+@st.fragment
+def anywhere_panel(service, user_name):
+    """🔎 Find Anywhere tab: one query against both sheets at once; its widgets rerun only this panel"""
+    st.markdown("### Find Order Anywhere")
+    st.caption("Searches the handover and bundling sheets together, for when you don't know which stage an order is at")
+    acol1, acol2 = st.columns([3, 1])
+    with acol1:
+        anywhere_search = st.text_input("Enter Order No, Customer, Vendor or any keyword", key="anywhere_search",
+                                        help="Field:value clauses work too; a field only one sheet has just skips the other")
+    with acol2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        anywhere_btn = st.button("🔍 Search", key="anywhere_search_btn", use_container_width=True)
+
+    if anywhere_btn and anywhere_search:
+        st.session_state['anywhere_query'] = anywhere_search
+        for stage in SEARCH_STAGES:
+            reset_results(f"anywhere_{stage.lower()}_results")
+    query = st.session_state.get('anywhere_query')
+    if not query:
+        return
+
+    # One slot per stage in a fixed order, each filled as soon as its sheet answers
+    summary = st.empty()
+    slots = {}
+    for stage in SEARCH_STAGES:
+        st.markdown(f"#### {stage}")
+        slots[stage] = st.empty()
+        slots[stage].info(f"⏳ Searching {stage.lower()} sheet...")
+    found = {}
+    for stage, headers, matches, error in search_everywhere(service, query):
+        with slots[stage].container():
+            if isinstance(error, ValueError):
+                # A field only the other sheet has: not a mistake when searching both
+                st.info(f"ℹ️ Not searchable here: {str(error)}")
+                continue
+            if error is not None:
+                report_search_error(error)
+                continue
+            found[stage] = len(matches)
+            STAGE_RESULTS[stage](f"anywhere_{stage.lower()}", service, user_name, headers, matches,
+                                 f"✅ {len(matches)} result(s) at the {stage.lower()} stage", query)
+    if found:
+        summary.caption(f"Results for '{query}': " +
+                        " · ".join(f"{stage} {found[stage]}" for stage in SEARCH_STAGES if stage in found))
+
+@st.fragment
+def pending_panel(service, user_name):
+    """📋 Pending List tab; its widgets rerun only this panel"""
+    st.markdown("### Pending Handover Orders")
+    if st.button("🔄 Refresh List", key="refresh_pending"):
+        st.session_state['pending_refreshed'] = True
+        get_snapshot_cache().invalidate(HANDOVER_SHEET_ID, HANDOVER_TAB)
+        if get_mirror() is not None:
+            get_mirror().request_sync()
+
+    sort_col, filter_col = st.columns([1, 2])
+    with sort_col:
+        sort = st.selectbox("Sort", PENDING_SORTS, key="pending_sort",
+                            on_change=reset_results, args=('pending_list',))
+    with filter_col:
+        search_term = st.text_input("Filter (order, vendor, customer, ...)", key="pending_filter",
+                                    on_change=reset_results, args=('pending_list',)).strip()
+
+    with st.spinner("Loading pending orders..."):
+        total, pending = paged_query('pending_list', lambda offset, limit: get_pending_handover(
+            service, sort, search_term, offset, limit))
+
+    with st.expander("📦 Bulk Handover"):
+        pending_orders = dict(match_targets(pending, find_order_column))
+        pending_labels = {
+            item['row_index']: f"{pending_orders[item['row_index']] or 'N/A'} — {item['data'].get('Vendor', item['data'].get('vendor', 'N/A'))}"
+            for item in pending
+        }
+        # Orders handed over since the last rerun are no longer selectable
+        if 'bulk_selected' in st.session_state:
+            st.session_state['bulk_selected'] = [
+                row_index for row_index in st.session_state['bulk_selected'] if row_index in pending_labels
+            ]
+        st.multiselect("Select pending orders (this page)", options=list(pending_labels),
+                       format_func=lambda row_index: pending_labels.get(row_index, f"Row {row_index}"),
+                       key="bulk_selected")
+        st.text_area("Or paste / scan order numbers (one per line)", key="bulk_orders")
+        st.button("✅ Hand over all", key="bulk_handover_btn", type="primary",
+                  on_click=run_bulk_handover, args=(service, user_name, pending_orders))
+    
+        if st.session_state.get('bulk_report'):
+            report = st.session_state['bulk_report']
+            handed = sum(1 for item in report if item['Result'].startswith('✅'))
+            st.success(f"✅ {handed} of {len(report)} order(s) handed over by {user_name}")
+            st.dataframe(report, use_container_width=True, hide_index=True)
+
+    flash = st.session_state.pop('pending_list_flash', None)
+    if flash:
+        st.success(f"⏳ {flash} handover(s) by {user_name} queued")
+    if pending:
+        st.info(f"📋 {total} pending orders" + (f" matching '{search_term}'" if search_term else ""))
+        export_controls('pending_list', service, {'stage': 'Handover', 'kind': 'pending', 'query': search_term},
+                        f"Export all {total} pending (sheet order)", total)
+        with render_timer('pending_list'):
+            selected = results_table('pending_list', None, pending, PENDING_RESULT_COLUMNS, total=total)
+        if selected:
+            st.button(f"✅ Mark Handover ({len(selected)})", key="pending_mark_selected", type="primary",
+                      on_click=queue_selected,
+                      args=('pending_list', queue_handover, service,
+                            match_targets(selected, find_order_column), user_name))
+    elif search_term:
+        st.warning(f"❌ No pending orders match '{search_term}'")
+    else:
+        st.success("🎉 No pending orders!")
+
+# Hours of history the Throughput tab charts and averages rates over
+THROUGHPUT_HOURS = 24
+
+@st.fragment(run_every=5)
+def throughput_panel(service, user_name):
+    """📈 Throughput tab: handover and packing rates from the status event log; refreshes on its own"""
+    st.markdown("### Throughput")
+    event_log = get_event_log()
+    summary = event_log.summary(THROUGHPUT_HOURS)
+    if not summary['events']:
+        st.info("No status events yet. They are recorded as orders are marked; older ones can be backfilled below.")
+    else:
+        hourly = summary['hourly']
+        totals = {stage: sum(counts) for stage, counts in hourly.items()}
+        metric_cols = st.columns(4)
+        metric_cols[0].metric(f"Handovers ({THROUGHPUT_HOURS}h)", totals.get('Handover', 0),
+                              delta=f"{hourly['Handover'][-1]} this hour")
+        metric_cols[1].metric(f"Bundling updates ({THROUGHPUT_HOURS}h)", totals.get('Bundling', 0),
+                              delta=f"{hourly['Bundling'][-1]} this hour")
+        p50, p90 = summary['handover_p50'], summary['handover_p90']
+        metric_cols[2].metric("Days to handover (median)", "—" if p50 is None else p50,
+                              delta=None if p90 is None else f"p90 {p90}", delta_color="off")
+        metric_cols[3].metric("Events logged", summary['events'])
+
+        st.markdown("#### Per hour")
+        st.bar_chart({'Hour': [datetime.fromtimestamp(start).strftime("%m-%d %H:00") for start in summary['hour_starts']],
+                      **hourly}, x='Hour', y=list(hourly))
+
+        st.markdown("#### Per operator")
+        st.dataframe(summary['operators'], hide_index=True, use_container_width=True)
+
+        st.markdown("#### By status")
+        st.dataframe([{'Stage': stage, 'Status': status, 'Count': count}
+                      for (stage, status), count in sorted(summary['by_status'].items())],
+                     hide_index=True, use_container_width=True)
+
+    user_email = st.session_state.get('user_info', {}).get('email', '')
+    if not METRICS_ADMINS or user_email.lower() in METRICS_ADMINS:
+        with st.expander("🗂️ Backfill from sheet notes"):
+            st.caption("One-off: reads the status notes already in both sheets, a chunk of rows per request, "
+                       "at background priority. Events already logged are skipped, so it is safe to run again.")
+            for stage, state in summary['backfill'].items():
+                outcome = "done" if state.get('done') else ("failed: " + state['error'] if state.get('error') else "running")
+                st.caption(f"{stage}: {outcome} — {state.get('rows') or 0} rows scanned, {state.get('found') or 0} events added")
+            if st.button("Run backfill", key="throughput_backfill"):
+                if not event_log.backfill(service):
+                    st.warning("A backfill is already running")
+
+@st.fragment(run_every=5)
+def pending_count_badge():
+    """Pending count in the sidebar, refreshed from already-loaded data every few seconds"""
+    count = get_pending_count()
+    st.metric("📋 Pending handovers", "—" if count is None else count)
+
+# Scan station: what a single-match scan marks automatically
+SCAN_ACTIONS = {
+    'Handover': ['Off', 'Done'],
+    'Bundling': ['Off', 'Packed', 'Hold', 'Issue'],
+}
+
+def process_scan(service, user_name):
+    """Scan input callback: exact lookup, optional auto-mark, then clear the box for the next scan"""
+    code = st.session_state.get('scan_code', '').strip()
+    st.session_state['scan_code'] = ''
+    if not code:
+        return
+    sheet = st.session_state.get('scan_sheet', 'Handover')
+    action = st.session_state.get('scan_action', 'Off')
+    
+    start = time.perf_counter()
+    matches = scan_handover(service, code) if sheet == 'Handover' else scan_bundling(service, code)
+    lookup_ms = (time.perf_counter() - start) * 1000
+    
+    marked = None
+    if action != 'Off' and len(matches) == 1:
+        if sheet == 'Handover':
+            (row_index, order_no), = match_targets(matches, find_order_column)
+            ticket = queue_handover(service, row_index, user_name, order_no)
+        else:
+            (row_index, order_id), = match_targets(matches, find_fleek_id_column)
+            ticket = queue_bundling_status(service, row_index, action, user_name, order_id)
+        if track_ticket(ticket):
+            marked = action
+    
+    st.session_state['scan_result'] = {'code': code, 'matches': matches, 'ms': lookup_ms, 'marked': marked}
+    if not matches:
+        outcome = '❌ Not found'
+    elif len(matches) > 1:
+        outcome = f"⚠️ {len(matches)} rows"
+    else:
+        outcome = f"⏳ {marked}" if marked else '✅ Found'
+    history = st.session_state.setdefault('scan_history', [])
+    history.insert(0, {'Time': datetime.now().strftime("%H:%M:%S"), 'Code': code,
+                       'Row': matches[0]['row_index'] if len(matches) == 1 else None, 'Result': outcome})
+    del history[20:]
+
+@st.fragment
+def scan_panel(service, user_name):
+    """📟 Scan Station tab: one barcode scan per lookup, exact match only"""
+    st.markdown("### Scan Station")
+    scol1, scol2 = st.columns(2)
+    with scol1:
+        sheet = st.radio("Sheet", list(SCAN_ACTIONS), horizontal=True, key="scan_sheet")
+    with scol2:
+        if st.session_state.get('scan_action') not in SCAN_ACTIONS[sheet]:
+            st.session_state['scan_action'] = 'Off'
+        st.radio("Auto-mark on single match", SCAN_ACTIONS[sheet], horizontal=True, key="scan_action")
+    
+    # Scanners type the code and press Enter, which fires on_change
+    st.text_input("Scan Order No / Fleek Order ID / Bundle ID", key="scan_code",
+                  on_change=process_scan, args=(service, user_name))
+    
+    result = st.session_state.get('scan_result')
+    if result:
+        if not result['matches']:
+            st.error(f"❌ {result['code']} not found · {result['ms']:.0f} ms")
+        else:
+            if len(result['matches']) > 1:
+                st.warning(f"⚠️ {result['code']} matches {len(result['matches'])} rows, nothing auto-marked · {result['ms']:.0f} ms")
+            elif result['marked']:
+                st.success(f"⏳ {result['code']} queued as {result['marked']} · {result['ms']:.0f} ms")
+            else:
+                st.success(f"✅ {result['code']} · {result['ms']:.0f} ms")
+            for match in result['matches']:
+                fields = [f"{key}: {value}" for key, value in match['data'].items() if value][:6]
+                st.markdown(f"**Row {match['row_index']}** · " + " · ".join(fields))
+    
+    if st.session_state.get('scan_history'):
+        st.dataframe(st.session_state['scan_history'], use_container_width=True, hide_index=True)
+
+PANELS = {
+    "🔍 Search & Handover": search_panel,
+    "📦 Bundling": bundling_panel,
+    "🔎 Find Anywhere": anywhere_panel,
+    "📋 Pending List": pending_panel,
+    "📟 Scan Station": scan_panel,
+    "📈 Throughput": throughput_panel,
+}
+
 def main():
     st.title("📦 Warehouse System")
     st.caption("Handover & Bundling Management")
@@ -396,10 +4121,48 @@ def main():
         st.markdown(f"### 👤 {user_name}")
         st.caption(user_email)
         if st.button("🚪 Logout", use_container_width=True):
+            get_service_pool().discard(st.session_state['credentials'])
+            get_export_links().revoke(credentials_key(st.session_state['credentials']))
+            if get_mirror() is not None:
+                get_mirror().forget_service(credentials_key(st.session_state['credentials']))
             del st.session_state['credentials']
             del st.session_state['user_info']
             st.rerun()
         st.markdown("---")
+        
+        pending_count_badge()
+        
+        with st.expander("🗄️ Sheet cache"):
+            cache_stats = get_snapshot_cache().stats()
+            st.caption(f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · "
+                       f"Hit rate: {cache_stats['hit_rate']:.0%} · TTL: {cache_stats['ttl']:.0f}s")
+            for entry in cache_stats['entries']:
+                st.caption(f"{entry['range']} — {entry['rows']} rows, {entry['bytes'] / 2 ** 20:.1f} MB, "
+                           f"{entry['age']:.0f}s old")
+        
+        if get_mirror() is not None:
+            with st.expander("🗃️ Local mirror"):
+                for tab_stats in get_mirror().stats():
+                    age = "never synced" if tab_stats['age'] is None else f"synced {tab_stats['age']:.0f}s ago"
+                    st.caption(f"{tab_stats['tab']} — {tab_stats['rows']} rows, {age}")
+                    if tab_stats.get('chunks'):
+                        st.caption(f"Last sync: {tab_stats['chunks_changed']}/{tab_stats['chunks']} pages changed, "
+                                   f"{tab_stats['rows_written']} rows written in {tab_stats['seconds']:.1f}s")
+                    if tab_stats.get('error'):
+                        st.caption(f"❌ {tab_stats['error']}")
+        
+        with st.expander("🚦 Sheets quota"):
+            scheduler_stats = get_scheduler().stats()
+            st.caption(f"Requests: {scheduler_stats['requests']} · Waiting: {scheduler_stats['waiting']} · "
+                       f"Waited: {scheduler_stats['waits']} · 429s: {scheduler_stats['throttled']}")
+            st.caption(" · ".join(f"{kind} tokens: {tokens:.0f}" for kind, tokens in scheduler_stats['tokens'].items()))
+        
+        with st.expander("✍️ Write queue", expanded=bool(st.session_state.get('write_tickets'))):
+            write_queue_panel()
+        
+        if not METRICS_ADMINS or user_email.lower() in METRICS_ADMINS:
+            with st.expander("⏱️ Performance"):
+                performance_panel()
     
     # Get sheets service
     try:
@@ -412,125 +4175,14 @@ def main():
             st.rerun()
         return
     
-    # Main tabs
-    tab1, tab2, tab3 = st.tabs(["🔍 Search & Handover", "📦 Bundling", "📋 Pending List"])
-    
-    # TAB 1: Search & Handover
-    with tab1:
-        st.markdown("### Search Order")
-        search_col1, search_col2 = st.columns([3, 1])
-        with search_col1:
-            search_term = st.text_input("Enter Order No, Vendor, or any keyword", key="handover_search")
-        with search_col2:
-            st.markdown("<br>", unsafe_allow_html=True)
-            search_btn = st.button("🔍 Search", key="handover_search_btn", use_container_width=True)
-        
-        if search_btn and search_term:
-            with st.spinner("Searching..."):
-                headers, data, matches = search_handover(service, search_term)
-                
-                if matches:
-                    st.success(f"✅ Found {len(matches)} result(s)")
-                    
-                    for match in matches:
-                        with st.expander(f"📄 Row {match['row_index']} - {match['data'].get('Order No', match['data'].get('order no', 'N/A'))}", expanded=True):
-                            col1, col2 = st.columns(2)
-                            
-                            data_items = list(match['data'].items())
-                            mid = len(data_items) // 2
-                            
-                            with col1:
-                                for key, value in data_items[:mid]:
-                                    st.markdown(f"**{key}:** {value}")
-                            with col2:
-                                for key, value in data_items[mid:]:
-                                    st.markdown(f"**{key}:** {value}")
-                            
-                            st.markdown("---")
-                            if st.button(f"✅ Mark Handover", key=f"handover_{match['row_index']}", type="primary"):
-                                if mark_handover(service, match['row_index'], user_name):
-                                    st.success(f"✅ Marked as handed over by {user_name}")
-                                    st.balloons()
-                else:
-                    st.warning("❌ No results found")
-    
-    # TAB 2: Bundling
-    with tab2:
-        st.markdown("### Search Bundling Order")
-        bcol1, bcol2 = st.columns([3, 1])
-        with bcol1:
-            bundling_search = st.text_input("Enter Order ID, Bundle ID, or Customer", key="bundling_search")
-        with bcol2:
-            st.markdown("<br>", unsafe_allow_html=True)
-            bundling_btn = st.button("🔍 Search", key="bundling_search_btn", use_container_width=True)
-        
-        if bundling_btn and bundling_search:
-            with st.spinner("Searching..."):
-                headers, data, matches = search_bundling(service, bundling_search)
-                
-                if matches:
-                    st.success(f"✅ Found {len(matches)} result(s)")
-                    
-                    for match in matches:
-                        with st.expander(f"📦 Row {match['row_index']} - {match['data'].get('Fleek/Order ID', match['data'].get('Bundle ID', 'N/A'))}", expanded=True):
-                            col1, col2 = st.columns(2)
-                            
-                            data_items = list(match['data'].items())
-                            mid = len(data_items) // 2
-                            
-                            with col1:
-                                for key, value in data_items[:mid]:
-                                    st.markdown(f"**{key}:** {value}")
-                            with col2:
-                                for key, value in data_items[mid:]:
-                                    st.markdown(f"**{key}:** {value}")
-                            
-                            st.markdown("---")
-                            status_col1, status_col2, status_col3 = st.columns(3)
-                            with status_col1:
-                                if st.button("✅ Packed", key=f"packed_{match['row_index']}"):
-                                    if mark_bundling_status(service, match['row_index'], "Packed", user_name):
-                                        st.success("Marked as Packed!")
-                            with status_col2:
-                                if st.button("⏸️ Hold", key=f"hold_{match['row_index']}"):
-                                    if mark_bundling_status(service, match['row_index'], "Hold", user_name):
-                                        st.success("Marked as Hold!")
-                            with status_col3:
-                                if st.button("❌ Issue", key=f"issue_{match['row_index']}"):
-                                    if mark_bundling_status(service, match['row_index'], "Issue", user_name):
-                                        st.success("Marked as Issue!")
-                else:
-                    st.warning("❌ No results found")
+    mirror = get_mirror()
+    if mirror is not None:
+        mirror.register_service(service, credentials_key(st.session_state['credentials']))
     
-    # TAB 3: Pending List
-    with tab3:
-        st.markdown("### Pending Handover Orders")
-        if st.button("🔄 Refresh List", key="refresh_pending"):
-            st.session_state['pending_refreshed'] = True
-        
-        with st.spinner("Loading pending orders..."):
-            pending = get_pending_handover(service)
-            
-            if pending:
-                st.info(f"📋 Showing {len(pending)} pending orders")
-                
-                for item in pending:
-                    order_no = item['data'].get('Order No', item['data'].get('order no', 'N/A'))
-                    vendor = item['data'].get('Vendor', item['data'].get('vendor', 'N/A'))
-                    
-                    col1, col2, col3 = st.columns([2, 2, 1])
-                    with col1:
-                        st.markdown(f"**{order_no}**")
-                    with col2:
-                        st.markdown(f"{vendor}")
-                    with col3:
-                        if st.button("✅", key=f"pending_{item['row_index']}", help="Mark Handover"):
-                            if mark_handover(service, item['row_index'], user_name):
-                                st.success("Done!")
-                                st.rerun()
-                    st.markdown("---")
-            else:
-                st.success("🎉 No pending orders!")
+    # Main tabs: only the selected panel runs, so idle panels cost no Sheets reads
+    active_tab = st.radio("Section", list(PANELS), horizontal=True, key="active_tab",
+                          label_visibility="collapsed")
+    PANELS[active_tab](service, user_name)
 
 if __name__ == "__main__":
     main()